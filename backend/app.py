@@ -1,30 +1,55 @@
 from flask_cors import CORS
 from flask_cors import cross_origin
-from flask import Flask, request, jsonify
-from werkzeug.security import generate_password_hash
-from werkzeug.security import check_password_hash
+from flask import Blueprint, Flask, Response, current_app, request, jsonify, stream_with_context
 from werkzeug.utils import secure_filename
 import os
-from flasgger import Swagger
+import click
+import csv
+import io
+import json
 
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager, create_access_token
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity, verify_jwt_in_request
 from sqlalchemy.sql import func
-from sqlalchemy import Numeric, DECIMAL
-from decimal import Decimal
-
-
-app = Flask(__name__)
-CORS(app, resources={r'/*': {'origins': 'http://localhost:3000'}})
-
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///users.sqlite3'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['JWT_SECRET_KEY'] = 'your_secret_key'  # Replace with a secure secret key
-
-jwt = JWTManager(app)
-db = SQLAlchemy(app)
-swagger = Swagger(app)
+from sqlalchemy import bindparam, delete, event, insert, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+from datetime import datetime, timedelta
+from collections import deque, namedtuple
+from functools import wraps
+
+import config
+from cache import ProductCache, MISSING
+from compression import install_response_compression
+from database import install_sqlite_pragmas
+from docs import build_api_spec, install_api_docs
+from migrations import upgrade
+from money import format_cents, parse_cents, to_units
+from metrics import RequestMetrics, install_request_metrics
+from passwords import PasswordPolicy
+from scheduler import MaintenanceScheduler
+from search import install_product_search, match_clause, product_search, rank_order, search_terms
+from tokens import TokenDenylist
+
+
+jwt = JWTManager()
+db = SQLAlchemy()
+token_denylist = TokenDenylist()
+# Seconds a cached product or listing page stays valid
+PRODUCT_CACHE_TTL = 60
+# Maximum number of cached entries before LRU eviction
+PRODUCT_CACHE_SIZE = 1024
+product_cache = ProductCache(ttl=PRODUCT_CACHE_TTL, maxsize=PRODUCT_CACHE_SIZE)
+request_metrics = RequestMetrics(slow_request_seconds=config.SLOW_REQUEST_SECONDS)
+password_policy = PasswordPolicy(method=config.PASSWORD_HASH_METHOD, scrypt_n=config.PASSWORD_SCRYPT_N,
+                                 scrypt_r=config.PASSWORD_SCRYPT_R, scrypt_p=config.PASSWORD_SCRYPT_P,
+                                 pbkdf2_iterations=config.PASSWORD_PBKDF2_ITERATIONS,
+                                 workers=config.PASSWORD_HASH_WORKERS)
+
+# The API's routes and CLI commands, registered on the app by build_app()
+api = Blueprint('api', __name__, cli_group=None)
 
 # Database Model Classes
 
@@ -37,10 +62,12 @@ class User(db.Model):
     password = db.Column(db.String(120), nullable=False)
     user_type = db.Column(db.String(10), nullable=False)
     vendor_name = db.Column(db.String(80), nullable=True)
-    vendor_revenue = db.Column(DECIMAL(10, 2), nullable=True, default=0.00)
+    # Money columns hold integer cents (see money.py). Their server defaults
+    # match the columns migration 0009 adds to older databases.
+    vendor_revenue_cents = db.Column(db.BigInteger, nullable=True, default=0, server_default='0')
     products = db.relationship('Product', backref='vendor', lazy=True)
     shopping_cart_items = db.relationship('ShoppingCartItem', backref='user', lazy=True)
-    sales = db.relationship('Sale', backref='vendor', lazy=True)
+    sales = db.relationship('Sale', backref='vendor', lazy=True, foreign_keys='Sale.vendor_id')
 
 
 class Product(db.Model):
@@ -49,24 +76,52 @@ class Product(db.Model):
     """
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
-    price = db.Column(db.Float, nullable=False)
+    price_cents = db.Column(db.Integer, nullable=False, server_default='0')
     description = db.Column(db.Text, nullable=True)
     vendor_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     vendor_name = db.Column(db.String(80), nullable=True)
+    # Catalog version of the last change to this product; the product's ETag
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     shopping_cart_items = db.relationship('ShoppingCartItem', backref='product', lazy=True)
 
+    # Composite indexes backing the keyset-paginated catalog listings. Each one
+    # ends in the primary key so that (sort value, id) is a unique cursor.
+    __table_args__ = (
+        db.Index('ix_product_vendor_id_id', 'vendor_id', 'id'),
+        db.Index('ix_product_price_cents_id', 'price_cents', 'id'),
+        db.Index('ix_product_vendor_id_price_cents_id', 'vendor_id', 'price_cents', 'id'),
+        db.Index('ix_product_name_id', 'name', 'id'),
+    )
+
+# Full-text index over name, description and vendor_name (see search.py)
+install_product_search(Product.__table__)
+
 
 class Sale(db.Model):
     """
     This class represents the Sale table in the database.
     """
     id = db.Column(db.Integer, primary_key=True)
-    vendor_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    vendor_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    # Rows older than these columns are backfilled by migration 0002; a sale whose
+    # customer or product no longer exists keeps NULL here. delete_product clears
+    # product_id itself, as SQLite does not enforce the foreign key.
+    customer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id', ondelete='SET NULL'), nullable=True, index=True)
+    # Snapshots of the names at the time of the sale, kept for order history
     customer_name = db.Column(db.String(80), nullable=False)
     product_name = db.Column(db.String(120), nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
-    total_price = db.Column(DECIMAL(10, 2), nullable=False)
+    total_price_cents = db.Column(db.BigInteger, nullable=False, server_default='0')
     status = db.Column(db.String(20), default='Processing')
+    # NULL for sales recorded before this column existed
+    created_at = db.Column(db.DateTime, nullable=True, default=func.now())
+
+    # Vendor-scoped sales listings: status filter plus keyset on id, and date ranges
+    __table_args__ = (
+        db.Index('ix_sale_vendor_id_status_id', 'vendor_id', 'status', 'id'),
+        db.Index('ix_sale_vendor_id_created_at', 'vendor_id', 'created_at'),
+    )
 
 class ShoppingCartItem(db.Model):
     """
@@ -77,23 +132,1122 @@ class ShoppingCartItem(db.Model):
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False, default=1)
     created_at = db.Column(db.DateTime, default=func.now())
+    # Set again whenever the line's quantity changes; lines left untouched for
+    # CART_EXPIRY_DAYS are deleted by the maintenance scheduler
+    updated_at = db.Column(db.DateTime, default=func.now(), onupdate=func.now(), index=True)
+
+    # One line per product in a cart; adding the same product again merges
+    # into it. Also serves the lookups of a user's cart by user_id.
+    __table_args__ = (
+        db.Index('uq_shopping_cart_item_user_id_product_id', 'user_id', 'product_id', unique=True),
+    )
+
+
+class VendorSalesStat(db.Model):
+    """
+    This class represents the VendorSalesStat table in the database.
+
+    Running totals of a vendor's sales per day, product and status. The rows
+    are updated in the same transaction as the sales they count, so reading a
+    vendor's breakdown never touches the Sale table.
+    """
+    vendor_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    # 'YYYY-MM-DD' of the sale, or 'unknown' for sales recorded before created_at existed
+    day = db.Column(db.String(10), primary_key=True)
+    # 0 for sales whose product could not be resolved
+    product_id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    sales_count = db.Column(db.Integer, nullable=False, default=0)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    revenue_cents = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+
+
+# Primary key of the only CatalogVersion row
+CATALOG_VERSION_ID = 1
+
+
+class CatalogVersion(db.Model):
+    """
+    This class represents the CatalogVersion table in the database.
+
+    A single row counting changes to the product catalog. Every product
+    write bumps it in the same transaction, so the catalog listings can be
+    revalidated with one primary key lookup instead of re-running their query.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+
+
+# The counter row must exist before the first product write
+@event.listens_for(CatalogVersion.__table__, 'after_create')
+def seed_catalog_version(table, connection, **kw):
+    connection.execute(table.insert().values(id=CATALOG_VERSION_ID, version=1))
 
 
 # Helper Functions
+
+# The current user as described by the claims of their access token
+TokenUser = namedtuple('TokenUser', ['id', 'username', 'user_type', 'vendor_name'])
+
+def access_token_for(user):
+    """
+    Create an access token for user.
+
+    The username, user type and vendor name are embedded as claims, so
+    protected routes can read them from the token instead of loading the
+    user. They are a snapshot taken at login and valid until the token expires.
+    """
+    return create_access_token(identity=user.id, additional_claims={
+        'username': user.username,
+        'user_type': user.user_type,
+        'vendor_name': user.vendor_name
+    })
+
+def current_token_user():
+    """
+    Return the current user as a TokenUser built from the JWT claims.
+
+    Tokens issued before the claims existed fall back to loading the user.
+    Returns None if such a user no longer exists.
+    """
+    claims = get_jwt()
+    if 'user_type' not in claims:
+        user = User.query.get(get_jwt_identity())
+        if user is None:
+            return None
+        return TokenUser(user.id, user.username, user.user_type, user.vendor_name)
+    return TokenUser(get_jwt_identity(), claims['username'], claims['user_type'], claims['vendor_name'])
+
+def role_required(*user_types, message='You are not allowed to access this resource'):
+    """
+    Like @jwt_required(), but also answers 403 unless the user's type is one of user_types.
+
+    The user type is read from the token claims, without a database query.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            verify_jwt_in_request()
+            user = current_token_user()
+            if user is None or user.user_type not in user_types:
+                return jsonify({'error': message}), 403
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+@jwt.token_in_blocklist_loader
+def is_token_revoked(jwt_header, jwt_payload):
+    return token_denylist.contains(jwt_payload['jti'])
+
+# INSERT ... ON CONFLICT DO UPDATE constructs for the dialects that have one
+UPSERT_INSERTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+# Maximum number of distinct products in a cart replaced at once
+MAX_CART_ITEMS = 1000
+
+def cart_quantity(value):
+    """Return value if it is a positive integer quantity, otherwise raise ValueError."""
+    if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+        raise ValueError('quantity must be a positive integer')
+    return value
+
+def upsert_cart_items(user_id, quantities, replace):
+    """
+    Write {product_id: quantity} into the user's cart with one upsert.
+
+    A product that is already in the cart keeps its row: its quantity is
+    increased by the new one, or set to it if replace is true, and its
+    updated_at is reset so that the line does not expire. Runs in the caller's
+    transaction.
+    """
+    table = ShoppingCartItem.__table__
+    rows = [{'user_id': user_id, 'product_id': product_id, 'quantity': quantity}
+            for product_id, quantity in quantities.items()]
+    dialect_insert = UPSERT_INSERTS.get(db.engine.dialect.name)
+    if dialect_insert is not None:
+        statement = dialect_insert(table)
+        new_quantity = statement.excluded.quantity if replace else table.c.quantity + statement.excluded.quantity
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.product_id],
+            set_={'quantity': new_quantity, 'updated_at': func.now()}
+        ), rows)
+        return
+
+    for row in rows:
+        updated = db.session.execute(
+            update(table)
+            .where(table.c.user_id == user_id, table.c.product_id == row['product_id'])
+            .values(quantity=row['quantity'] if replace else table.c.quantity + row['quantity'],
+                    updated_at=func.now())
+        ).rowcount
+        if not updated:
+            db.session.execute(insert(table).values(row))
+
 def add_to_cart(user_id, product_id, quantity):
-    item = ShoppingCartItem(user_id=user_id, product_id=product_id, quantity=quantity)
-    db.session.add(item)
+    """Add quantity of a product to the user's cart, merging with an existing line for it."""
+    try:
+        upsert_cart_items(user_id, {product_id: quantity}, replace=False)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+def set_cart(user_id, items):
+    """
+    Replace the user's whole cart with items, a list of (product_id, quantity).
+
+    Products listed more than once are merged. Lines for products that stay
+    in the cart keep their id. One DELETE of the products that are no longer
+    listed and one upsert of the rest, in a single transaction.
+    """
+    quantities = {}
+    for product_id, quantity in items:
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    try:
+        db.session.execute(
+            delete(ShoppingCartItem).where(ShoppingCartItem.user_id == user_id,
+                                           ShoppingCartItem.product_id.not_in(quantities)),
+            execution_options={'synchronize_session': False}
+        )
+        if quantities:
+            upsert_cart_items(user_id, quantities, replace=True)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+def cart_item_to_dict(item):
+    return {
+        'id': item.id,
+        'product_id': item.product_id,
+        'quantity': item.quantity,
+        'created_at': item.created_at
+    }
+
+# Rows fetched from the database per round trip, and serialized rows per
+# response chunk, when streaming large listings
+STREAM_BATCH_SIZE = 1000
+
+def stream_json_list(key, query, serialize):
+    """
+    Stream ``{"<key>": [...]}`` for every row of query as it is read.
+
+    The query is iterated with yield_per so only one batch of rows is held in
+    memory at a time, and the JSON is written out in chunks through a
+    generator response instead of being built up as one big list first.
+    """
+    def generate():
+        yield '{"%s": [' % key
+        separator = ''
+        chunk = []
+        for row in query.yield_per(STREAM_BATCH_SIZE):
+            chunk.append(current_app.json.dumps(serialize(row)))
+            if len(chunk) == STREAM_BATCH_SIZE:
+                yield separator + ','.join(chunk)
+                separator = ','
+                chunk = []
+        if chunk:
+            yield separator + ','.join(chunk)
+        yield ']}'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+def sale_to_dict(sale):
+    return {
+        'id': sale.id,
+        'vendor_id': sale.vendor_id,
+        'customer_id': sale.customer_id,
+        'product_id': sale.product_id,
+        'customer_name': sale.customer_name,
+        'product_name': sale.product_name,
+        'quantity': sale.quantity,
+        'total_price': format_cents(sale.total_price_cents),
+        'status': sale.status,
+        'created_at': sale.created_at
+    }
+
+# Catalog pagination settings
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Supported values of the ``sort`` query parameter for product listings
+PRODUCT_SORTS = ('id', 'price', '-price', 'name')
+# Column behind each sort key
+SORT_COLUMNS = {'price': Product.price_cents, 'name': Product.name}
+
+def catalog_version(session=None):
+    """Return the current catalog version."""
+    session = session or db.session
+    return session.scalar(select(CatalogVersion.version).where(CatalogVersion.id == CATALOG_VERSION_ID))
+
+def bump_catalog_version():
+    """
+    Count a change to the catalog and return the new version.
+
+    Call it in the transaction that makes the change, and store the result as
+    the version of every product it changes. Versions only grow, so a product
+    whose id is reused after a delete never gets an ETag the old one had.
+    """
+    table = CatalogVersion.__table__
+    statement = update(table).where(table.c.id == CATALOG_VERSION_ID).values(version=table.c.version + 1)
+    if db.engine.dialect.update_returning:
+        return db.session.execute(statement.returning(table.c.version)).scalar_one()
+    # The UPDATE holds the row's write lock until commit, so no other
+    # transaction can bump the version between it and the read
+    db.session.execute(statement)
+    return db.session.scalar(select(table.c.version).where(table.c.id == CATALOG_VERSION_ID))
+
+def conditional_response(etag, build_response):
+    """
+    Answer a GET with 304 Not Modified if its If-None-Match already names etag.
+
+    Otherwise call build_response() and tag a successful result with etag, so
+    that the client can send it back on its next poll. The ETag is weak because
+    the same version may be sent with different content encodings.
+    """
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.make_response(build_response())
+        if response.status_code != 200:
+            return response
+    response.set_etag(etag, weak=True)
+    # Clients may keep the response but must revalidate it before every use
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def catalog_listing_response():
+    """Serve a page of the catalog listing, or 304 if the catalog has not changed."""
+    # Read the version before the rows: a concurrent write can then only make
+    # the ETag older than the page, which costs the client one extra download
+    version = catalog_version()
+
+    def build_page():
+        # Serve the page from the cache, querying the database on a miss
+        try:
+            output, cursor = product_cache.get_or_load(
+                product_cache.listing_key(request.args, version), lambda: get_product_page(request.args))
+            products = list_payload(output, request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        # Return the page of products and the cursor for the next page
+        return jsonify({'products': products, **cursor})
+
+    return conditional_response(f'catalog-{version}', build_page)
+
+# Shapes a list endpoint can return its rows in, selected with ?format=
+LIST_FORMATS = ('rows', 'columns')
+
+def list_payload(rows, args):
+    """
+    Return a list of row dicts in the format named by the ``format`` argument.
+
+    ``rows`` (the default) returns them unchanged. ``columns`` names every key
+    once, as ``{'columns': [...], 'rows': [[...], ...]}``, which is smaller on
+    the wire and quicker to serialize for long lists.
+    """
+    list_format = args.get('format', 'rows')
+    if list_format not in LIST_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(LIST_FORMATS)}")
+    if list_format == 'rows':
+        return rows
+    columns = list(rows[0]) if rows else []
+    return {'columns': columns, 'rows': [[row[column] for column in columns] for row in rows]}
+
+def product_to_dict(product):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'price': to_units(product.price_cents),
+        'description': product.description,
+        'vendor_id': product.vendor_id,
+        'vendor_name': product.vendor_name
+    }
+
+def price_arg(args, name):
+    """Return the price query string argument name in cents, or None if it is absent."""
+    value = args.get(name)
+    return None if value is None else parse_cents(value, name)
+
+def get_product_page(args, session=None):
+    """
+    Return one keyset-paginated page of products and the cursor for the next one.
+
+    Reads ``after_id``, ``after_value``, ``limit``, ``vendor_id``, ``min_price``,
+    ``max_price`` and ``sort`` from the query string. Rows are located through
+    the composite indexes on Product instead of OFFSET, so the cost of a page
+    does not depend on how deep into the catalog it is. The cursor is a dict
+    of ``next_after_id`` and, for the price and name sorts, ``next_after_value``:
+    the sort value of the last product, so that the next page can be found
+    even if that product is deleted meanwhile. Raises ValueError on invalid
+    arguments. Queries db.session unless another session is given.
+    """
+    session = session or db.session
+    # Malformed ids and limits fall back to the default, as with any MultiDict.get(type=...)
+    after_id = args.get('after_id', type=int)
+    after_value = args.get('after_value')
+    limit = args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    vendor_id = args.get('vendor_id', type=int)
+    min_price = price_arg(args, 'min_price')
+    max_price = price_arg(args, 'max_price')
+    sort = args.get('sort', 'id')
+
+    if sort not in PRODUCT_SORTS:
+        raise ValueError(f"sort must be one of: {', '.join(PRODUCT_SORTS)}")
+    if limit is None or limit < 1 or limit > MAX_PAGE_SIZE:
+        raise ValueError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+    if after_value is not None and (after_id is None or sort == 'id'):
+        raise ValueError('after_value is only used with after_id and the price or name sort')
+
+    query = session.query(Product)
+    if vendor_id is not None:
+        query = query.filter(Product.vendor_id == vendor_id)
+    if min_price is not None:
+        query = query.filter(Product.price_cents >= min_price)
+    if max_price is not None:
+        query = query.filter(Product.price_cents <= max_price)
+
+    descending = sort.startswith('-')
+    sort_key = sort.lstrip('-')
+    sort_column = Product.id if sort == 'id' else SORT_COLUMNS[sort_key]
+
+    if after_id is not None:
+        if sort == 'id':
+            query = query.filter(Product.id > after_id)
+        else:
+            if after_value is not None:
+                anchor = parse_cents(after_value, 'after_value') if sort_key == 'price' else after_value
+            else:
+                # Clients that only pass after_id: resolve the sort value of the
+                # cursor row with a primary key lookup
+                anchor = session.scalar(select(sort_column).where(Product.id == after_id))
+                if anchor is None:
+                    raise ValueError('after_id does not refer to an existing product; pass after_value as well')
+            # Compare as a row value so the database can seek straight to the
+            # cursor position in the (sort value, id) index
+            cursor = tuple_(sort_column, Product.id)
+            if descending:
+                query = query.filter(cursor < tuple_(anchor, after_id))
+            else:
+                query = query.filter(cursor > tuple_(anchor, after_id))
+
+    if sort == 'id':
+        query = query.order_by(Product.id)
+    elif descending:
+        query = query.order_by(sort_column.desc(), Product.id.desc())
+    else:
+        query = query.order_by(sort_column, Product.id)
+
+    # Fetch one extra row to find out whether there is a next page
+    products = [product_to_dict(product) for product in query.limit(limit + 1).all()]
+    last = products[limit - 1] if len(products) > limit else None
+    cursor = {'next_after_id': last['id'] if last else None}
+    if sort != 'id':
+        cursor['next_after_value'] = last[sort_key] if last else None
+    return products[:limit], cursor
+
+def get_cart_items(user_id, session=None):
+    """Return the lines of a user's cart with their product details, oldest first."""
+    session = session or db.session
+    cart_items = []
+    # Load the cart items together with their products in a single joined query.
+    # Items whose product no longer exists are dropped by the inner join.
+    rows = session.query(ShoppingCartItem, Product) \
+        .join(Product, Product.id == ShoppingCartItem.product_id) \
+        .filter(ShoppingCartItem.user_id == user_id) \
+        .order_by(ShoppingCartItem.id) \
+        .all()
+    for item, product in rows:
+        # Append the item's data to the cart_items list
+        cart_item = {
+            'cart_item_id': item.id, 
+            'product_id': product.id,
+            'product_name': product.name,
+            'product_price': to_units(product.price_cents),
+            'product_description': product.description,
+            'vendor_id': product.vendor_id,
+            'vendor_name': product.vendor_name,
+            'quantity': item.quantity
+        }
+        cart_items.append(cart_item)
+    return cart_items
+
+def get_customer_orders(user_id, session=None):
+    """Return a customer's orders, oldest first, each with its vendor's name."""
+    session = session or db.session
+    # Query the database for the user's orders along with each order's vendor name
+    orders = session.query(Sale, User.vendor_name, User.id) \
+        .outerjoin(User, User.id == Sale.vendor_id) \
+        .filter(Sale.customer_id == user_id) \
+        .order_by(Sale.id) \
+        .all()
+    output = []
+
+    # Iterate through the orders
+    for order, vendor_name, found_vendor_id in orders:
+        # Append each order's data to the output list
+        order_data = {}
+        order_data['id'] = order.id
+        if found_vendor_id is None:
+            order_data['vendor_name'] = 'Vendor not found'
+        else:
+            order_data['vendor_name'] = vendor_name
+        order_data['vendor_id'] = order.vendor_id
+        order_data['product_id'] = order.product_id
+        order_data['product_name'] = order.product_name
+        order_data['quantity'] = order.quantity
+        order_data['total_price'] = format_cents(order.total_price_cents)
+        order_data['status'] = order.status
+        output.append(order_data)
+    return output
+
+def get_product_details(product_id, version, session=None):
+    """
+    Return the given version of a product as a dict, from the cache or the
+    database, or None if the product no longer exists.
+    """
+    session = session or db.session
+    # Serve the product from the cache if we have this version of it
+    product_data = product_cache.get_product(product_id, version)
+    if product_data is MISSING:
+        # Query the database for the product using the provided ID
+        product = session.get(Product, product_id)
+        if product is None:
+            return None
+        # Otherwise, create a dictionary with the product's data and cache it
+        product_data = product_to_dict(product)
+        product_cache.set_product(product_id, product_data, version)
+    return product_data
+
+# Ranked search results deeper than this are not served
+MAX_SEARCH_OFFSET = 1000
+
+def search_products(args):
+    """
+    Return one page of products matching ``q``, best matches first, and the offset of the next page.
+
+    Reads ``q``, ``vendor_id``, ``offset`` and ``limit`` from the query string.
+    A product matches when its name, description or vendor name contains every
+    word of ``q``; the last word may be the start of a word. On SQLite the
+    FTS5 index finds and ranks the matches without reading the rest of the
+    catalog. Other databases fall back to LIKE filters in ID order. Raises
+    ValueError on invalid arguments.
+    """
+    terms = search_terms(args.get('q'))
+    vendor_id = args.get('vendor_id', type=int)
+    offset = args.get('offset', 0, type=int)
+    limit = args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+
+    if not terms:
+        raise ValueError('q must contain at least one word')
+    if limit is None or limit < 1 or limit > MAX_PAGE_SIZE:
+        raise ValueError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+    if offset is None or offset < 0 or offset > MAX_SEARCH_OFFSET:
+        raise ValueError(f'offset must be between 0 and {MAX_SEARCH_OFFSET}')
+
+    if db.engine.dialect.name == 'sqlite':
+        query = Product.query \
+            .join(product_search, product_search.c.rowid == Product.id) \
+            .filter(match_clause(terms)) \
+            .order_by(rank_order(), Product.id)
+    else:
+        query = Product.query.order_by(Product.id)
+        for term in terms:
+            query = query.filter(Product.name.icontains(term, autoescape=True)
+                                 | Product.description.icontains(term, autoescape=True)
+                                 | Product.vendor_name.icontains(term, autoescape=True))
+    if vendor_id is not None:
+        query = query.filter(Product.vendor_id == vendor_id)
+
+    # Fetch one extra row to find out whether there is a next page
+    products = query.offset(offset).limit(limit + 1).all()
+    next_offset = offset + limit if len(products) > limit else None
+    return [product_to_dict(product) for product in products[:limit]], next_offset
+
+# Statuses a sale can be in
+SALE_STATUSES = ('Processing', 'Shipped')
+
+def sale_date_conditions(start_date, end_date):
+    """
+    Return the SQL conditions for sales made in [start_date, end_date).
+
+    Both bounds are optional ISO 8601 strings. Raises ValueError if one
+    cannot be parsed.
+    """
+    conditions = []
+    try:
+        if start_date:
+            conditions.append(Sale.created_at >= datetime.fromisoformat(start_date))
+        if end_date:
+            conditions.append(Sale.created_at < datetime.fromisoformat(end_date))
+    except (TypeError, ValueError):
+        raise ValueError('start_date and end_date must be ISO 8601 dates')
+    return conditions
+
+def get_vendor_sales_page(vendor_id, args):
+    """
+    Return one page of a vendor's sales, newest first, and the cursor for the next one.
+
+    Reads ``status``, ``start_date``, ``end_date``, ``after_id`` and ``limit``
+    from the query string. Everything is filtered in SQL through the
+    (vendor_id, status, id) and (vendor_id, created_at) indexes, so a page
+    does not get slower as the vendor's sales history grows; with a date
+    range it is bounded by the sales inside the range. Raises ValueError on
+    invalid arguments.
+    """
+    after_id = args.get('after_id', type=int)
+    limit = args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    status = args.get('status')
+    if limit is None or limit < 1 or limit > MAX_PAGE_SIZE:
+        raise ValueError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+    if status is not None and status not in SALE_STATUSES:
+        raise ValueError(f"status must be one of: {', '.join(SALE_STATUSES)}")
+
+    query = Sale.query.filter(Sale.vendor_id == vendor_id,
+                              *sale_date_conditions(args.get('start_date'), args.get('end_date')))
+    if status is not None:
+        query = query.filter(Sale.status == status)
+    if after_id is not None:
+        query = query.filter(Sale.id < after_id)
+
+    # Fetch one extra row to find out whether there is a next page
+    sales = query.order_by(Sale.id.desc()).limit(limit + 1).all()
+    next_after_id = sales[limit - 1].id if len(sales) > limit else None
+    return [sale_to_dict(sale) for sale in sales[:limit]], next_after_id
+
+# Maximum number of sale ids accepted by one bulk shipping request
+MAX_BULK_SHIP_IDS = 1000
+
+def ship_sales(vendor_id, sale_ids=None, start_date=None, end_date=None):
+    """
+    Move a vendor's Processing sales to Shipped and return {sale_id: outcome}.
+
+    Either ship the given sale ids, or every Processing sale of the vendor
+    made in [start_date, end_date); at least one of the dates is required, so
+    that a request missing its selection never ships everything. Raises
+    ValueError if there is no selection or a date is invalid. The transition
+    is a single conditional UPDATE plus one upsert of the vendor sales stats,
+    so the cost is one transaction whatever the batch size. For explicit ids
+    the outcome is 'shipped', 'already_shipped', 'forbidden' (another vendor's
+    sale) or 'not_found'.
+    """
+    conditions = [Sale.vendor_id == vendor_id, Sale.status == 'Processing']
+    if sale_ids is None:
+        if not start_date and not end_date:
+            raise ValueError('Give saleIds, or a startDate and/or endDate')
+        conditions.extend(sale_date_conditions(start_date, end_date))
+    else:
+        conditions.append(Sale.id.in_(sale_ids))
+    statement = update(Sale).where(*conditions).values(status='Shipped')
+    # What the vendor sales stats need to move each shipped sale between statuses
+    shipped_columns = (Sale.id, Sale.created_at, Sale.product_id, Sale.quantity, Sale.total_price_cents)
+
+    try:
+        if sale_ids is not None:
+            # Look up the ids that will not be shipped to explain why
+            existing = dict(db.session.query(Sale.id, Sale.vendor_id).filter(Sale.id.in_(sale_ids)).all())
+        if db.engine.dialect.update_returning:
+            shipped_rows = db.session.execute(statement.returning(*shipped_columns),
+                                              execution_options={'synchronize_session': False}).all()
+        else:
+            # Lock the eligible rows so the ids we report match the ones updated
+            shipped_rows = db.session.execute(select(*shipped_columns).where(*conditions).with_for_update()).all()
+            db.session.execute(statement, execution_options={'synchronize_session': False})
+        stats = {}
+        for sale_id, created_at, product_id, quantity, total_price_cents in shipped_rows:
+            count_sale(stats, sales_stat_key(vendor_id, created_at, product_id, 'Processing'),
+                       quantity, total_price_cents, sign=-1)
+            count_sale(stats, sales_stat_key(vendor_id, created_at, product_id, 'Shipped'),
+                       quantity, total_price_cents)
+        apply_vendor_stats(stats)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    shipped = {row[0] for row in shipped_rows}
+    if sale_ids is None:
+        return {sale_id: 'shipped' for sale_id in sorted(shipped)}
+    outcomes = {}
+    for sale_id in sale_ids:
+        if sale_id in shipped:
+            outcomes[sale_id] = 'shipped'
+        elif sale_id not in existing:
+            outcomes[sale_id] = 'not_found'
+        elif existing[sale_id] != vendor_id:
+            outcomes[sale_id] = 'forbidden'
+        else:
+            outcomes[sale_id] = 'already_shipped'
+    return outcomes
+
+# Rows written per executemany batch and commit during a bulk product import
+IMPORT_CHUNK_SIZE = 500
+# Row errors listed in an import report; any further errors are only counted
+MAX_REPORTED_IMPORT_ERRORS = 100
+# Largest id an integer primary key can hold; larger ones cannot even be bound
+MAX_ID = 2 ** 63 - 1
+
+def import_file_format(upload):
+    """Return 'csv' or 'jsonl' for an uploaded file, or raise ValueError."""
+    filename = (upload.filename or '').lower()
+    if filename.endswith(('.jsonl', '.ndjson')) or upload.mimetype in ('application/jsonl', 'application/x-ndjson'):
+        return 'jsonl'
+    if filename.endswith('.csv') or upload.mimetype == 'text/csv':
+        return 'csv'
+    raise ValueError('Upload a .csv or .jsonl file')
+
+def read_import_rows(upload, file_format):
+    """
+    Lazily yield (line number, row dict) from an uploaded CSV or JSONL file.
+
+    The file is decoded line by line, so memory use does not depend on its
+    size. Lines that are not valid JSON yield a string error instead of a dict.
+    """
+    text = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+    if file_format == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield line_number, 'Invalid JSON'
+                continue
+            yield line_number, row if isinstance(row, dict) else 'Each line must be a JSON object'
+
+def validate_import_row(row):
+    """Return (values, None) for a valid product row or (None, error message)."""
+    if not isinstance(row, dict):
+        return None, row
+    values = {}
+    product_id = row.get('id')
+    if product_id not in (None, ''):
+        try:
+            values['id'] = int(product_id)
+        except (TypeError, ValueError):
+            return None, 'id must be an integer'
+        if not 1 <= values['id'] <= MAX_ID:
+            return None, f"Product {values['id']} not found"
+    name = row.get('name')
+    name = name.strip() if isinstance(name, str) else None
+    if not name:
+        return None, 'name is required'
+    if len(name) > 120:
+        return None, 'name must be at most 120 characters'
+    values['name'] = name
+    try:
+        values['price_cents'] = parse_cents(row.get('price'), 'price')
+    except ValueError as e:
+        return None, str(e)
+    description = row.get('description')
+    values['description'] = None if description in (None, '') else str(description)
+    return values, None
+
+def import_products(vendor, rows):
+    """
+    Insert or update a vendor's products from (line number, row) pairs.
+
+    Rows without an id create products; rows with an id update that product
+    if it belongs to the vendor. Rows are validated as they stream in and
+    written in chunks of IMPORT_CHUNK_SIZE, each chunk with one executemany
+    INSERT, one executemany UPDATE and one commit, so only a single chunk is
+    held in memory. Yields a progress report after every chunk; the last one
+    is the final result.
+    """
+    report = {'processed': 0, 'inserted': 0, 'updated': 0, 'failed': 0, 'errors': [], 'done': False}
+
+    def fail(line_number, message):
+        report['failed'] += 1
+        if len(report['errors']) < MAX_REPORTED_IMPORT_ERRORS:
+            report['errors'].append({'line': line_number, 'error': message})
+
+    def write_chunk(chunk):
+        inserts = [values for _, values in chunk if 'id' not in values]
+        updates = [(line_number, values) for line_number, values in chunk if 'id' in values]
+        if updates:
+            # One lookup for every id in the chunk to check ownership
+            owners = dict(db.session.query(Product.id, Product.vendor_id)
+                          .filter(Product.id.in_([values['id'] for _, values in updates])))
+            owned = []
+            for line_number, values in updates:
+                if values['id'] not in owners:
+                    fail(line_number, f"Product {values['id']} not found")
+                elif owners[values['id']] != vendor.id:
+                    fail(line_number, f"Product {values['id']} belongs to another vendor")
+                else:
+                    owned.append(values)
+            updates = owned
+        try:
+            # The whole chunk is one catalog change
+            version = bump_catalog_version() if inserts or updates else None
+            if inserts:
+                db.session.execute(insert(Product), [
+                    dict(values, vendor_id=vendor.id, vendor_name=vendor.vendor_name, version=version)
+                    for values in inserts])
+            if updates:
+                product_table = Product.__table__
+                db.session.execute(
+                    update(product_table)
+                    .where(product_table.c.id == bindparam('product_id'))
+                    .values(name=bindparam('name'), price_cents=bindparam('price_cents'),
+                            description=bindparam('description'),
+                            version=version),
+                    [{'product_id': values['id'], 'name': values['name'], 'price_cents': values['price_cents'],
+                      'description': values['description']} for values in updates]
+                )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        report['inserted'] += len(inserts)
+        report['updated'] += len(updates)
+        for values in updates:
+            product_cache.invalidate_product(values['id'], vendor.id)
+        if inserts:
+            product_cache.invalidate_product(None, vendor.id)
+
+    chunk = []
+    for line_number, row in rows:
+        report['processed'] += 1
+        values, error = validate_import_row(row)
+        if error:
+            fail(line_number, error)
+        else:
+            chunk.append((line_number, values))
+        if len(chunk) == IMPORT_CHUNK_SIZE:
+            write_chunk(chunk)
+            chunk = []
+            yield dict(report)
+    if chunk:
+        write_chunk(chunk)
+    report['done'] = True
+    yield report
+
+def sales_stat_key(vendor_id, created_at, product_id, status):
+    """Return the VendorSalesStat primary key that a sale is counted under."""
+    day = created_at.strftime('%Y-%m-%d') if created_at else 'unknown'
+    return vendor_id, day, product_id or 0, status or 'Processing'
+
+def count_sale(deltas, key, quantity, revenue_cents, sign=1):
+    """Add (or with sign=-1 remove) one sale to the per-key deltas."""
+    entry = deltas.setdefault(key, [0, 0, 0])
+    entry[0] += sign
+    entry[1] += sign * quantity
+    entry[2] += sign * revenue_cents
+
+def apply_vendor_stats(deltas):
+    """
+    Add {key: [sales_count, quantity, revenue_cents]} deltas to VendorSalesStat.
+
+    Runs in the caller's transaction. On SQLite and PostgreSQL all rows are
+    upserted with one executemany INSERT ... ON CONFLICT DO UPDATE; other
+    databases fall back to an UPDATE per row and an INSERT for missing rows.
+    """
+    if not deltas:
+        return
+    table = VendorSalesStat.__table__
+    rows = [{'vendor_id': vendor_id, 'day': day, 'product_id': product_id, 'status': status,
+             'sales_count': sales_count, 'quantity': quantity, 'revenue_cents': revenue_cents}
+            for (vendor_id, day, product_id, status), (sales_count, quantity, revenue_cents) in deltas.items()]
+    totals = ('sales_count', 'quantity', 'revenue_cents')
+
+    dialect_insert = UPSERT_INSERTS.get(db.engine.dialect.name)
+    if dialect_insert is not None:
+        statement = dialect_insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=[column for column in table.primary_key],
+            set_={name: table.c[name] + statement.excluded[name] for name in totals}
+        )
+        db.session.execute(statement, rows)
+        return
+
+    for row in rows:
+        updated = db.session.execute(
+            update(table)
+            .where(*(column == row[column.name] for column in table.primary_key))
+            .values({name: table.c[name] + row[name] for name in totals})
+        ).rowcount
+        if not updated:
+            db.session.execute(insert(table).values(row))
+
+def forget_product_stats(product_id):
+    """
+    Count a deleted product's sales under product 0, as rebuild_vendor_stats() does.
+
+    Runs in the caller's transaction, after its sales lost their product_id,
+    so that a new product given the same id starts without stats.
+    """
+    rows = db.session.execute(
+        select(VendorSalesStat.vendor_id, VendorSalesStat.day, VendorSalesStat.status,
+               VendorSalesStat.sales_count, VendorSalesStat.quantity, VendorSalesStat.revenue_cents)
+        .where(VendorSalesStat.product_id == product_id)
+    ).all()
+    if not rows:
+        return
+    db.session.execute(delete(VendorSalesStat).where(VendorSalesStat.product_id == product_id))
+    deltas = {}
+    for vendor_id, day, status, sales_count, quantity, revenue_cents in rows:
+        entry = deltas.setdefault((vendor_id, day, 0, status), [0, 0, 0])
+        entry[0] += sales_count
+        entry[1] += quantity
+        entry[2] += revenue_cents
+    apply_vendor_stats(deltas)
+
+def sale_day(dialect_name):
+    """Return SQL for the day sales_stat_key() counts a sale under, or None if the dialect has no date formatting."""
+    if dialect_name == 'sqlite':
+        day = func.strftime('%Y-%m-%d', Sale.created_at)
+    elif dialect_name == 'postgresql':
+        day = func.to_char(Sale.created_at, 'YYYY-MM-DD')
+    else:
+        return None
+    return func.coalesce(day, 'unknown')
+
+def rebuild_vendor_stats():
+    """
+    Recompute VendorSalesStat from the Sale table and return the number of rows written.
+
+    On SQLite and PostgreSQL the database sums the sales itself with one
+    INSERT ... SELECT ... GROUP BY; money is in integer cents, so the SQL
+    totals are exact. Elsewhere sales are streamed in batches and aggregated
+    in memory. The old rows are deleted first, which takes the write lock
+    before reading, so sales committed meanwhile cannot be missed.
+    """
+    try:
+        db.session.execute(delete(VendorSalesStat))
+        day = sale_day(db.engine.dialect.name)
+        if day is not None:
+            # Compute the stats key of each sale once, then group by it
+            sales = select(Sale.vendor_id, day.label('day'),
+                           func.coalesce(Sale.product_id, 0).label('product_id'),
+                           func.coalesce(Sale.status, 'Processing').label('status'),
+                           Sale.quantity, Sale.total_price_cents).subquery()
+            keys = (sales.c.vendor_id, sales.c.day, sales.c.product_id, sales.c.status)
+            totals = select(*keys, func.count(), func.sum(sales.c.quantity), func.sum(sales.c.total_price_cents)) \
+                .group_by(*keys)
+            written = db.session.execute(insert(VendorSalesStat).from_select(
+                ['vendor_id', 'day', 'product_id', 'status', 'sales_count', 'quantity', 'revenue_cents'], totals)
+            ).rowcount
+        else:
+            deltas = {}
+            rows = db.session.execute(
+                select(Sale.vendor_id, Sale.created_at, Sale.product_id, Sale.status, Sale.quantity,
+                       Sale.total_price_cents),
+                execution_options={'yield_per': STREAM_BATCH_SIZE}
+            )
+            for vendor_id, created_at, product_id, status, quantity, total_price_cents in rows:
+                count_sale(deltas, sales_stat_key(vendor_id, created_at, product_id, status),
+                           quantity, total_price_cents)
+            apply_vendor_stats(deltas)
+            written = len(deltas)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return written
+
+def vendor_stats_summary(vendor_id, start_day=None, end_day=None):
+    """
+    Return a vendor's sales totals broken down by status, product and day.
+
+    Reads only the vendor's VendorSalesStat rows. start_day and end_day
+    (inclusive, YYYY-MM-DD) restrict the breakdown to dated sales.
+    """
+    query = db.session.query(VendorSalesStat.day, VendorSalesStat.product_id, VendorSalesStat.status,
+                             VendorSalesStat.sales_count, VendorSalesStat.quantity, VendorSalesStat.revenue_cents) \
+        .filter(VendorSalesStat.vendor_id == vendor_id, VendorSalesStat.sales_count != 0)
+    for value in (start_day, end_day):
+        if value is not None:
+            try:
+                datetime.strptime(value, '%Y-%m-%d')
+            except ValueError:
+                raise ValueError('Dates must be in YYYY-MM-DD format')
+    if start_day is not None:
+        query = query.filter(VendorSalesStat.day >= start_day)
+    if end_day is not None:
+        query = query.filter(VendorSalesStat.day <= end_day)
+    if start_day is not None or end_day is not None:
+        query = query.filter(VendorSalesStat.day != 'unknown')
+
+    total = [0, 0, 0]
+    by_status, by_product, by_day = {}, {}, {}
+    for day, product_id, status, sales_count, quantity, revenue_cents in query.all():
+        for entry in (total, by_status.setdefault(status, [0, 0, 0]), by_product.setdefault(product_id, [0, 0, 0]),
+                      by_day.setdefault(day, [0, 0, 0])):
+            entry[0] += sales_count
+            entry[1] += quantity
+            entry[2] += revenue_cents
+
+    def totals(entry):
+        return {'sales_count': entry[0], 'quantity': entry[1], 'revenue': format_cents(entry[2])}
+
+    return {
+        'total': totals(total),
+        'by_status': {status: totals(entry) for status, entry in sorted(by_status.items())},
+        'by_product': [dict(product_id=product_id or None, **totals(entry))
+                       for product_id, entry in sorted(by_product.items())],
+        'by_day': [dict(day=day, **totals(entry)) for day, entry in sorted(by_day.items())]
+    }
+
+# Cart lines deleted per transaction when expiring abandoned carts
+CART_EXPIRY_CHUNK_SIZE = 500
+
+def expire_cart_items():
+    """
+    Delete cart lines not added to or changed for CART_EXPIRY_DAYS and return how many were deleted.
+
+    Lines are deleted in chunks of CART_EXPIRY_CHUNK_SIZE, each in its own
+    short transaction, so cart writes and checkouts are only held up briefly.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=config.CART_EXPIRY_DAYS)
+    deleted = 0
+    while True:
+        chunk = select(ShoppingCartItem.id).where(ShoppingCartItem.updated_at < cutoff).limit(CART_EXPIRY_CHUNK_SIZE)
+        try:
+            count = db.session.execute(
+                delete(ShoppingCartItem).where(ShoppingCartItem.id.in_(chunk)),
+                execution_options={'synchronize_session': False}
+            ).rowcount
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        deleted += count
+        if count < CART_EXPIRY_CHUNK_SIZE:
+            return deleted
+
+def optimize_database():
+    """Refresh the statistics the query planner uses to choose indexes."""
+    connection = db.session.connection()
+    if db.engine.dialect.name == 'sqlite':
+        # Re-analyze every table whose statistics are missing or stale, reading
+        # at most about 1000 rows per index so the run stays short
+        connection.exec_driver_sql('PRAGMA analysis_limit = 1000')
+        connection.exec_driver_sql('PRAGMA optimize = 0x10002')
+    else:
+        connection.exec_driver_sql('ANALYZE')
     db.session.commit()
 
-def get_cart(user_id):
-    user = User.query.get(user_id)
-    if user is None:
-        return []
-    return user.shopping_cart_items
+def checkpoint_wal():
+    """
+    Copy the SQLite write-ahead log into the database file.
+
+    A PASSIVE checkpoint neither waits for readers nor blocks writers; pages
+    still needed by open readers are left for the next run, and SQLite starts
+    reusing the log from the beginning once it has all been copied. Returns
+    the number of pages checkpointed, or None when the database is not SQLite
+    in WAL mode.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return None
+    with db.engine.connect() as connection:
+        busy, log_pages, checkpointed = connection.exec_driver_sql('PRAGMA wal_checkpoint(PASSIVE)').one()
+    return None if log_pages == -1 else checkpointed
+
+# build_app() runs the jobs in the app's context
+maintenance = MaintenanceScheduler(lock_path=config.MAINTENANCE_LOCK_FILE)
+maintenance.add_job('expire_cart_items', config.CART_EXPIRY_INTERVAL, expire_cart_items)
+maintenance.add_job('optimize_database', config.DB_OPTIMIZE_INTERVAL, optimize_database)
+maintenance.add_job('checkpoint_wal', config.WAL_CHECKPOINT_INTERVAL, checkpoint_wal)
+
+class EmptyCartError(Exception):
+    pass
+
+class CheckoutConflictError(Exception):
+    pass
+
+def checkout_cart(user):
+    """
+    Turn the user's shopping cart into sales and return the per-vendor summary.
+
+    The cart is read with a single join and aggregated per vendor in Python.
+    The writes are then applied as a fixed number of set-based statements in
+    one short transaction: the cart rows are claimed with one DELETE, the sales
+    are bulk-inserted, and each vendor's revenue is incremented in SQL with
+    ``vendor_revenue_cents = vendor_revenue_cents + ?`` so concurrent checkouts never
+    overwrite each other's totals. The vendor sales stats are upserted in the
+    same transaction. Raises EmptyCartError if there is nothing
+    to check out and CheckoutConflictError if a concurrent checkout claimed
+    the same cart rows first.
+    """
+    lines = db.session.query(ShoppingCartItem.id, ShoppingCartItem.quantity, Product.id,
+                             Product.name, Product.price_cents, Product.vendor_id, User.vendor_name) \
+        .join(Product, Product.id == ShoppingCartItem.product_id) \
+        .outerjoin(User, User.id == Product.vendor_id) \
+        .filter(ShoppingCartItem.user_id == user.id) \
+        .order_by(ShoppingCartItem.id) \
+        .all()
+    if not lines:
+        # Items pointing at deleted products are left alone, as before
+        if ShoppingCartItem.query.filter_by(user_id=user.id).first() is None:
+            raise EmptyCartError()
+        return {}
+
+    vendor_purchases = {}
+    vendor_revenue = {}
+    stats = {}
+    sales = []
+    # One timestamp for the whole order, so the sales and their stats agree on the day
+    created_at = datetime.utcnow()
+    for cart_item_id, quantity, product_id, product_name, price_cents, vendor_id, vendor_name in lines:
+        # Integer cents, so every total below is exact
+        line_total = price_cents * quantity
+        sales.append({
+            'vendor_id': vendor_id,
+            'customer_id': user.id,
+            'product_id': product_id,
+            'customer_name': user.username,
+            'product_name': product_name,
+            'quantity': quantity,
+            'total_price_cents': line_total,
+            'created_at': created_at
+        })
+        count_sale(stats, sales_stat_key(vendor_id, created_at, product_id, 'Processing'), quantity, line_total)
+        if vendor_id in vendor_purchases:
+            vendor_purchases[vendor_id]['total'] += line_total
+            vendor_purchases[vendor_id]['products'].append(product_name)
+        else:
+            vendor_purchases[vendor_id] = {
+                'vendor_name': vendor_name,
+                'total': line_total,
+                'products': [product_name]
+            }
+        vendor_revenue[vendor_id] = vendor_revenue.get(vendor_id, 0) + line_total
+
+    cart_item_ids = [line[0] for line in lines]
+    try:
+        # Claim the cart rows first. If another checkout got to any of them,
+        # fewer rows are deleted and the whole transaction is rolled back.
+        claimed = db.session.execute(
+            delete(ShoppingCartItem).where(ShoppingCartItem.id.in_(cart_item_ids)),
+            execution_options={'synchronize_session': False}
+        ).rowcount
+        if claimed != len(cart_item_ids):
+            raise CheckoutConflictError()
+        db.session.execute(insert(Sale), sales)
+        db.session.execute(
+            update(User.__table__)
+            .where(User.__table__.c.id == bindparam('target_id'))
+            .values(vendor_revenue_cents=func.coalesce(User.__table__.c.vendor_revenue_cents, 0) + bindparam('amount')),
+            [{'target_id': vendor_id, 'amount': amount} for vendor_id, amount in vendor_revenue.items()]
+        )
+        apply_vendor_stats(stats)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    # The summary reports totals in whole units, as it always has
+    for purchase in vendor_purchases.values():
+        purchase['total'] = to_units(purchase['total'])
+    return vendor_purchases
 
 # API Routes
 
-@app.route('/signup', methods=['POST'])
+@api.route('/signup', methods=['POST'])
 def signup():
     """
     Create a new user
@@ -124,6 +1278,8 @@ def signup():
     responses:
       201:
         description: User created
+      400:
+        description: Missing username, password or userType
       409:
         description: User already exists
     """
@@ -136,38 +1292,32 @@ def signup():
     password = data.get('password')
     user_type = data.get('userType')
     vendor_name = data.get('vendorName')
+    if not username or not password or not user_type:
+        return jsonify({'message': 'username, password and userType are required.'}), 400
 
-    # Query the database to see if the user already exists
-    existing_user = User.query.filter_by(username=username).first()
-    if existing_user:
-        # If the user already exists, return a message and a conflict status code
-        return jsonify({'message': 'User already exists.'}), 409
+    # Hash the provided password for secure storage
+    hashed_password = password_policy.hash(password)
 
-    # If the user does not exist, hash the provided password for secure storage
-    hashed_password = generate_password_hash(password, method='sha256')
+    # Create the new user with every field set up front; the vendor name only applies to vendors
+    new_user = User(username=username, password=hashed_password, user_type=user_type,
+                    vendor_name=vendor_name if user_type == 'vendor' and vendor_name else None)
 
-    # Create a new user instance with the provided username and hashed password, and specified user type
-    new_user = User(username=username, password=hashed_password, user_type=user_type)
-
-    # Add the new user to the current database session
+    # Save the user with a single INSERT and commit. The unique constraint on
+    # username decides between concurrent signups for the same name, so there
+    # is no separate existence check that could race.
     db.session.add(new_user)
-    # Commit the current database session, effectively saving the new user to the database
-    db.session.commit()
-
-    # If the user type is 'vendor' and a vendor name has been provided
-    if user_type == 'vendor' and vendor_name:
-        # Fetch the newly created user from the database
-        current_user = User.query.filter_by(username=username).first()
-        # Update the vendor name for this user
-        current_user.vendor_name = vendor_name
-        # Commit the changes to the database
+    try:
         db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        # If the user already exists, return a message and a conflict status code
+        return jsonify({'message': 'User already exists.'}), 409
 
     # Return a success message and a created status code
     return jsonify({'message': 'User created'}), 201
 
 
-@app.route('/login', methods=['POST'])
+@api.route('/login', methods=['POST'])
 def login():
     """
     Authenticate user and generate access token
@@ -213,20 +1363,42 @@ def login():
     user = User.query.filter_by(username=username).first()
 
     # If the user does not exist or the password does not match
-    if not user or not check_password_hash(user.password, password):
+    if not user or not password_policy.verify(user.password, password):
         # Return an error message and unauthorized status code
         return jsonify({'message': 'Invalid username or password'}), 401
 
+    # Upgrade a hash written under older hashing settings while the password is at hand
+    if password_policy.needs_rehash(user.password):
+        user.password = password_policy.hash(password)
+        db.session.commit()
+
     # If the user exists and the password matches, create an access token for the user
-    access_token = create_access_token(identity=user.id)
+    access_token = access_token_for(user)
     # Return the access token and user type in the response
     return jsonify({
         'access_token': access_token,
         'user_type': user.user_type
     }), 200
 
+@api.route('/logout', methods=['POST'])
+@jwt_required()
+def logout():
+    """
+    Revoke the current access token
+    ---
+    security:
+      - JWT: []
+    responses:
+      200:
+        description: Token revoked
+    """
+    # Deny the token until it would have expired anyway
+    claims = get_jwt()
+    token_denylist.add(claims['jti'], claims['exp'])
+    return jsonify({'message': 'Logged out'}), 200
+
 # Display all users
-@app.route('/users', methods=['GET'])
+@api.route('/users', methods=['GET'])
 def users():
     """
     Get all users
@@ -270,11 +1442,12 @@ def users():
                       description: The shopping cart items associated with the user (if applicable)
                       # Add properties as needed for the shopping cart item object
     """
-    # Query the database for all users
-    users = User.query.all()
-    output = []
-    # Iterate over all users
-    for user in users:
+    # Query the database for all users, loading their products and cart items
+    # one batch of users at a time
+    users = User.query.order_by(User.id) \
+        .options(selectinload(User.products), selectinload(User.shopping_cart_items))
+
+    def serialize(user):
         # Create a dictionary to store user data
         user_data = {}
         # Populate the dictionary with data from the user
@@ -282,23 +1455,72 @@ def users():
         user_data['password'] = user.password
         user_data['user_type'] = user.user_type
         user_data['vendor_name'] = user.vendor_name
-        user_data['vendor_revenue'] = user.vendor_revenue
-        user_data['products'] = user.products
-        user_data['shopping_cart_items'] = user.shopping_cart_items
-        # Append the user data to the output list
-        output.append(user_data)
-    # Return the list of all users in the response
-    return jsonify({'users': output})
+        user_data['vendor_revenue'] = (format_cents(user.vendor_revenue_cents)
+                                       if user.vendor_revenue_cents is not None else None)
+        user_data['products'] = [product_to_dict(product) for product in user.products]
+        user_data['shopping_cart_items'] = [cart_item_to_dict(item) for item in user.shopping_cart_items]
+        return user_data
+
+    # Stream the list of all users in the response
+    return stream_json_list('users', users, serialize)
 
 
-@app.route('/products', methods=['GET'])
+@api.route('/products', methods=['GET'])
 def get_all_products():
     """
-    Get all products
+    Get a page of products
     ---
+    parameters:
+      - in: query
+        name: format
+        type: string
+        required: false
+        enum: ['rows', 'columns']
+        description: "rows (default) for one object per row, or columns for {columns: [...], rows: [[...]]}"
+      - in: query
+        name: after_id
+        type: integer
+        required: false
+        description: Return products that come after this product ID in the chosen sort order
+      - in: query
+        name: after_value
+        type: string
+        required: false
+        description: The next_after_value that came with after_id, for the price and name sorts
+      - in: query
+        name: limit
+        type: integer
+        required: false
+        description: Maximum number of products to return (default 50, max 200)
+      - in: query
+        name: vendor_id
+        type: integer
+        required: false
+        description: Only return products from this vendor
+      - in: query
+        name: min_price
+        type: number
+        required: false
+        description: Only return products at or above this price
+      - in: query
+        name: max_price
+        type: number
+        required: false
+        description: Only return products at or below this price
+      - in: query
+        name: sort
+        type: string
+        required: false
+        enum: ['id', 'price', '-price', 'name']
+        description: Sort order of the listing (default id)
+      - in: header
+        name: If-None-Match
+        type: string
+        required: false
+        description: ETag of a previous response; answered with 304 if the catalog has not changed
     responses:
       200:
-        description: List of all products
+        description: A page of products
         schema:
           type: object
           properties:
@@ -325,29 +1547,80 @@ def get_all_products():
                   vendor_name:
                     type: string
                     description: The name of the vendor associated with the product
+            next_after_id:
+              type: integer
+              description: Cursor to pass as after_id for the next page, or null on the last page
+            next_after_value:
+              type: string
+              description: "Price and name sorts only: sort value to pass as after_value with after_id"
+      304:
+        description: The catalog has not changed since the version named in If-None-Match
+      400:
+        description: Invalid pagination or filter parameter
     """
-    # Query the database for all products
-    products = Product.query.all()
-    output = []
-    # Iterate over all products
-    for product in products:
-        # Create a dictionary to store product data
-        product_data = {}
-        # Populate the dictionary with data from the product
-        product_data['id'] = product.id
-        product_data['name'] = product.name
-        product_data['price'] = product.price
-        product_data['description'] = product.description
-        product_data['vendor_id'] = product.vendor_id
-        product_data['vendor_name'] = product.vendor_name
-        # Append the product data to the output list
-        output.append(product_data)
-    # Return the list of all products in the response
-    return jsonify({'products': output})
-
-
-@app.route('/create-product', methods=['POST'])
-@jwt_required()
+    # Serve the page, or 304 if the client's copy is still current
+    return catalog_listing_response()
+
+
+@api.route('/search-products', methods=['GET'])
+def search_products_route():
+    """
+    Search products by name, description and vendor name
+    ---
+    parameters:
+      - in: query
+        name: format
+        type: string
+        required: false
+        enum: ['rows', 'columns']
+        description: "rows (default) for one object per row, or columns for {columns: [...], rows: [[...]]}"
+      - in: query
+        name: q
+        type: string
+        required: true
+        description: Words to search for. Every word must match; the last one also matches as a prefix.
+      - in: query
+        name: vendor_id
+        type: integer
+        required: false
+        description: Only return products from this vendor
+      - in: query
+        name: offset
+        type: integer
+        required: false
+        description: Number of results to skip (default 0, max 1000)
+      - in: query
+        name: limit
+        type: integer
+        required: false
+        description: Maximum number of products to return (default 50, max 200)
+    responses:
+      200:
+        description: A page of matching products, best matches first
+        schema:
+          type: object
+          properties:
+            products:
+              type: array
+              items:
+                type: object
+                description: A product, in the same format as /products
+            next_offset:
+              type: integer
+              description: Offset to pass for the next page, or null on the last page
+      400:
+        description: Missing search words or invalid pagination parameter
+    """
+    try:
+        output, next_offset = search_products(request.args)
+        products = list_payload(output, request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'products': products, 'next_offset': next_offset})
+
+
+@api.route('/create-product', methods=['POST'])
+@role_required('vendor', message='Only vendors can create products')
 def create_product():
     """
     Create a new product
@@ -373,31 +1646,124 @@ def create_product():
     responses:
       201:
         description: Product created
+      400:
+        description: Missing or invalid price
+      403:
+        description: The current user is not a vendor
     """
     # Get form data from the request
     name = request.form.get('name')
-    price = request.form.get('price')
     description = request.form.get('description')
-
-    # Get the id of the current user from the JWT
-    vendor_id = get_jwt_identity()
-
-    # Query the database for the current user (the vendor)
-    vendor = User.query.filter_by(id=vendor_id).first()
-    # Create a new product with the provided data and vendor information
-    new_product = Product(name=name, price=price, description=description, vendor_id=vendor_id, vendor_name=vendor.vendor_name)
+    # Prices are stored in integer cents
+    try:
+        price_cents = parse_cents(request.form.get('price'), 'price')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Get the current user (the vendor) from the JWT claims
+    vendor = current_token_user()
+
+    # Create a new product with the provided data and vendor information,
+    # versioned with the catalog change it makes
+    new_product = Product(name=name, price_cents=price_cents, description=description, vendor_id=vendor.id,
+                          vendor_name=vendor.vendor_name, version=bump_catalog_version())
     
     # Add the new product to the current database session
     db.session.add(new_product)
     # Commit the current database session, effectively saving the new product to the database
     db.session.commit()
+    # Cached listings of this vendor and of the whole catalog are now stale
+    product_cache.invalidate_product(None, new_product.vendor_id)
 
     # Return a success message and a created status code
     return jsonify({'message': 'Product created'}), 201
 
-    
 
-@app.route('/shopping-cart', methods=['GET'])
+
+@api.route('/import-products', methods=['POST'])
+@role_required('vendor', message='Only vendors can import products')
+def import_products_route():
+    """
+    Create or update many products from a CSV or JSONL file
+    ---
+    security:
+      - JWT: []
+    consumes:
+      - multipart/form-data
+    parameters:
+      - in: formData
+        name: file
+        type: file
+        required: true
+        description: >
+          A .csv file with a header row, or a .jsonl file with one JSON object per line.
+          Columns/keys are name, price, description and optionally id. Rows with an id
+          update that product, rows without one create a new product.
+    produces:
+      - application/json
+      - application/x-ndjson
+    responses:
+      200:
+        description: >
+          The import report. When the request accepts application/x-ndjson, a report line
+          is streamed after every chunk of rows and the last line has done set to true.
+        schema:
+          type: object
+          properties:
+            processed:
+              type: integer
+              description: Number of rows read
+            inserted:
+              type: integer
+              description: Number of products created
+            updated:
+              type: integer
+              description: Number of products updated
+            failed:
+              type: integer
+              description: Number of rows rejected
+            errors:
+              type: array
+              description: The first 100 rejected rows
+              items:
+                type: object
+                properties:
+                  line:
+                    type: integer
+                    description: Line number in the file
+                  error:
+                    type: string
+                    description: Why the row was rejected
+            done:
+              type: boolean
+              description: Whether the whole file has been processed
+      400:
+        description: No file, or a file that is not CSV or JSONL
+      403:
+        description: The current user is not a vendor
+    """
+    # Get the vendor from the JWT claims
+    vendor = current_token_user()
+
+    upload = request.files.get('file')
+    if upload is None:
+        return jsonify({'error': 'No file uploaded'}), 400
+    try:
+        file_format = import_file_format(upload)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    reports = import_products(vendor, read_import_rows(upload, file_format))
+    if request.accept_mimetypes.best == 'application/x-ndjson':
+        # Stream a progress line after every chunk
+        return Response(stream_with_context(json.dumps(report) + '\n' for report in reports),
+                        mimetype='application/x-ndjson')
+    # Otherwise run the import to the end and return only the final report
+    report = deque(reports, maxlen=1).pop()
+    return jsonify(report), 200
+
+
+@api.route('/shopping-cart', methods=['GET'])
 def get_all_shopping_cart_items():
     """
     Get all shopping cart items for all users
@@ -427,23 +1793,34 @@ def get_all_shopping_cart_items():
                     items:
                       type: object
                       description: The shopping cart items for the user
-                      # Add properties as needed for the shopping cart item object
+                      properties:
+                        id:
+                          type: integer
+                          description: The ID of the cart item
+                        product_id:
+                          type: integer
+                          description: The ID of the product in the cart
+                        quantity:
+                          type: integer
+                          description: The quantity of the product in the cart
+                        created_at:
+                          type: string
+                          description: When the item was added to the cart
     """
-    # Query all users from the database
-    users = User.query.all()
-    output = []
-    # Iterate through each user
-    for user in users:
+    # Query all users from the database, loading cart items one batch of users at a time
+    users = User.query.order_by(User.id).options(selectinload(User.shopping_cart_items))
+
+    def serialize(user):
         user_data = {}
         user_data['username'] = user.username
         user_data['user_type'] = user.user_type
         user_data['vendor_name'] = user.vendor_name
-        # Call the function get_cart() to retrieve cart items for the user
-        user_data['shopping_cart_items'] = get_cart(user.id)
-        output.append(user_data)
-    return jsonify({'users': output})
+        user_data['shopping_cart_items'] = [cart_item_to_dict(item) for item in user.shopping_cart_items]
+        return user_data
 
-@app.route('/add-to-cart', methods=['POST'])
+    return stream_json_list('users', users, serialize)
+
+@api.route('/add-to-cart', methods=['POST'])
 @jwt_required()
 def add_product_to_shopping_cart():
     """
@@ -466,7 +1843,9 @@ def add_product_to_shopping_cart():
               description: The quantity of the product to add (default is 1 if not provided)
     responses:
       201:
-        description: Product added to cart
+        description: Product added to cart, or its quantity increased if it was already there
+      400:
+        description: Missing product ID or invalid quantity
     """
     # Get the user's ID from the JWT
     user_id = get_jwt_identity()
@@ -474,12 +1853,17 @@ def add_product_to_shopping_cart():
     data = request.get_json()
     # Extract the product ID and quantity from the data
     product_id = data.get('productId')
-    quantity = data.get('quantity', 1)  # Default to 1 if quantity is not provided
+    if not isinstance(product_id, int):
+        return jsonify({'error': 'productId must be an integer'}), 400
+    try:
+        quantity = cart_quantity(data.get('quantity', 1))  # Default to 1 if quantity is not provided
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     # Call the function add_to_cart() to add the product to the user's cart
     add_to_cart(user_id, product_id, quantity)
     return jsonify({'message': 'Product added to cart'}), 201
 
-@app.route('/api/remove-from-cart', methods=['POST'])
+@api.route('/api/remove-from-cart', methods=['POST'])
 @jwt_required()
 def remove_from_cart():
     """
@@ -521,7 +1905,7 @@ def remove_from_cart():
         return jsonify({'error': 'Item not found in cart'}), 404
 
 
-@app.route('/api/shopping_cart', methods=['GET'])
+@api.route('/api/shopping_cart', methods=['GET'])
 @jwt_required()
 def get_user_cart_info():
     """
@@ -529,6 +1913,13 @@ def get_user_cart_info():
     ---
     security:
       - JWT: []
+    parameters:
+      - in: query
+        name: format
+        type: string
+        required: false
+        enum: ['rows', 'columns']
+        description: "rows (default) for one object per row, or columns for {columns: [...], rows: [[...]]}"
     responses:
       200:
         description: User's shopping cart information
@@ -563,36 +1954,75 @@ def get_user_cart_info():
                     description: The name of the vendor
                   quantity:
                     type: integer
-                    description: The quantity of the product in the cart
+                    description: The quantity of the product in the cart
+      400:
+        description: Unknown format
+    """
+    # Get the user's ID from the JWT
+    user_id = get_jwt_identity()
+
+    cart_items = get_cart_items(user_id)
+
+    # Return the lines in the requested format
+    try:
+        return jsonify({'cart': list_payload(cart_items, request.args)})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@api.route('/api/shopping_cart', methods=['PUT'])
+@jwt_required()
+def set_user_cart():
+    """
+    Replace the whole shopping cart
+    ---
+    security:
+      - JWT: []
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          properties:
+            items:
+              type: array
+              description: The new contents of the cart; an empty list empties it
+              items:
+                type: object
+                properties:
+                  productId:
+                    type: integer
+                    description: The ID of the product
+                  quantity:
+                    type: integer
+                    description: The quantity of the product
+    responses:
+      200:
+        description: Cart replaced
+      400:
+        description: Invalid items
     """
-    # Query the database for the user
-    user = User.query.get(get_jwt_identity())
-    if user is None:
-        return jsonify({'error': 'User not found'}), 404
-
-    cart_items = []
-    # Iterate through the user's shopping cart items
-    for item in user.shopping_cart_items:
-        # Query the database for the product
-        product = Product.query.get(item.product_id)
-        if product is None:
-            continue
-        # Append the item's data to the cart_items list
-        cart_item = {
-            'cart_item_id': item.id, 
-            'product_id': product.id,
-            'product_name': product.name,
-            'product_price': product.price,
-            'product_description': product.description,
-            'vendor_id': product.vendor_id,
-            'vendor_name': product.vendor_name,
-            'quantity': item.quantity
-        }
-        cart_items.append(cart_item)
-
-    return jsonify({'cart': cart_items})
-
-@app.route('/place-order', methods=['POST'])
+    # Get the user's ID from the JWT
+    user_id = get_jwt_identity()
+    data = request.get_json() or {}
+    items = data.get('items')
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        return jsonify({'error': 'items must be a list of objects'}), 400
+    if len(items) > MAX_CART_ITEMS:
+        return jsonify({'error': f'A cart can hold at most {MAX_CART_ITEMS} items'}), 400
+    try:
+        cart = []
+        for item in items:
+            if not isinstance(item.get('productId'), int):
+                raise ValueError('productId must be an integer')
+            cart.append((item['productId'], cart_quantity(item.get('quantity', 1))))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    set_cart(user_id, cart)
+    return jsonify({'message': 'Cart updated'}), 200
+
+@api.route('/place-order', methods=['POST'])
 @jwt_required()
 def place_order():
     """
@@ -620,56 +2050,25 @@ def place_order():
                   type: string
                 description: The products purchased from the vendor
     """
-    # Get the user's ID from the JWT
-    user_id = get_jwt_identity()
-    # Query the database for the user and their cart items
-    user = User.query.get(user_id)
-    cart_items = ShoppingCartItem.query.filter_by(user_id=user_id).all()
+    # Get the user placing the order from the JWT claims
+    user = current_token_user()
+    if user is None:
+        return jsonify({'error': 'User not found'}), 404
 
-    if not cart_items:
+    try:
+        vendor_purchases = checkout_cart(user)
+    except EmptyCartError:
         # If the cart is empty, return an error message
         return jsonify({'message': 'Shopping cart is empty'}), 400
-
-    vendor_purchases = {}
-
-    # Iterate through the cart items
-    for item in cart_items:
-        # Query the database for the product
-        product = Product.query.get(item.product_id)
-        if product is None:
-            continue
-
-        vendor_id = product.vendor_id
-        # Query the database for the vendor
-        vendor = User.query.get(vendor_id)
-
-        # Create a new sale record
-        sale = Sale(vendor_id=vendor_id, customer_name=user.username, product_name=product.name, quantity=item.quantity, total_price=product.price * item.quantity)
-        db.session.add(sale)
-
-        # Update the vendor's total purchases and revenue
-        if vendor_id in vendor_purchases:
-            vendor_purchases[vendor_id]['total'] += product.price * item.quantity
-            vendor_purchases[vendor_id]['products'].append(product.name)
-        else:
-            vendor_purchases[vendor_id] = {
-                'vendor_name': vendor.vendor_name,
-                'total': product.price * item.quantity,
-                'products': [product.name]
-            }
-
-        vendor.vendor_revenue += Decimal(product.price) * Decimal(item.quantity)
-        # Remove the item from the cart
-        db.session.delete(item)
-
-    # Commit the changes to the database
-    db.session.commit()
+    except CheckoutConflictError:
+        # Another checkout consumed some of the same cart items first
+        return jsonify({'message': 'Shopping cart changed during checkout, please try again'}), 409
 
     return jsonify(vendor_purchases)
 
 
 
-@app.route('/get-vendor-revenue', methods=['GET'])
+@api.route('/get-vendor-revenue', methods=['GET'])
 @jwt_required()
 def get_vendor_revenue():
     """
@@ -698,11 +2097,71 @@ def get_vendor_revenue():
         return jsonify({'error': 'Vendor not found'}), 404
 
     # Print the vendor's revenue
-    print(f"Vendor ID: {vendor.id}, Vendor Name: {vendor.vendor_name}, Vendor Revenue: {vendor.vendor_revenue}")
+    vendor_revenue = format_cents(vendor.vendor_revenue_cents or 0)
+    print(f"Vendor ID: {vendor.id}, Vendor Name: {vendor.vendor_name}, Vendor Revenue: {vendor_revenue}")
+
+    return jsonify({'vendor_name': vendor.vendor_name, 'vendor_revenue': vendor_revenue})
+
+@api.route('/get-vendor-stats', methods=['GET'])
+@role_required('vendor', message='Only vendors can view their sales stats')
+def get_vendor_stats():
+    """
+    Get the current vendor's sales totals broken down by status, product and day
+    ---
+    security:
+      - JWT: []
+    parameters:
+      - in: query
+        name: start_date
+        type: string
+        required: false
+        description: Only count sales made on or after this day (YYYY-MM-DD)
+      - in: query
+        name: end_date
+        type: string
+        required: false
+        description: Only count sales made on or before this day (YYYY-MM-DD)
+    responses:
+      200:
+        description: Sales totals of the vendor. Every total has sales_count, quantity and revenue.
+        schema:
+          type: object
+          properties:
+            vendor_name:
+              type: string
+              description: The name of the vendor
+            total:
+              type: object
+              description: Totals over all counted sales
+            by_status:
+              type: object
+              description: Totals keyed by sale status
+            by_product:
+              type: array
+              items:
+                type: object
+              description: Totals per product_id (null for sales whose product is unknown or deleted)
+            by_day:
+              type: array
+              items:
+                type: object
+              description: Totals per day, oldest first; "unknown" holds sales recorded without a date
+      400:
+        description: Invalid date
+      403:
+        description: The current user is not a vendor
+    """
+    # Get the vendor from the JWT claims
+    vendor = current_token_user()
+
+    try:
+        summary = vendor_stats_summary(vendor.id, request.args.get('start_date'), request.args.get('end_date'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-    return jsonify({'vendor_name': vendor.vendor_name, 'vendor_revenue': str(vendor.vendor_revenue)})
+    return jsonify(dict(vendor_name=vendor.vendor_name, **summary)), 200
 
-@app.route('/get_sales', methods=['GET'])
+@api.route('/get_sales', methods=['GET'])
 @jwt_required()
 def get_all_sales():
     """
@@ -727,6 +2186,12 @@ def get_all_sales():
                   vendor_id:
                     type: integer
                     description: The ID of the vendor
+                  customer_id:
+                    type: integer
+                    description: The ID of the customer (null if the account no longer exists)
+                  product_id:
+                    type: integer
+                    description: The ID of the product (null if the product no longer exists)
                   customer_name:
                     type: string
                     description: The name of the customer
@@ -742,29 +2207,88 @@ def get_all_sales():
                   status:
                     type: string
                     description: The status of the sale
+                  created_at:
+                    type: string
+                    description: When the sale was made (null for older sales)
     """
     # Query the database for all sales
-    sales = Sale.query.all()
-    output = []
+    sales = Sale.query.order_by(Sale.id)
+
+    # Stream the sales out as they are read instead of building the whole list
+    return stream_json_list('sales', sales, sale_to_dict)
 
-    # Iterate through the sales
-    for sale in sales:
-        # Append each sale's data to the output list
-        sale_data = {}
-        sale_data['id'] = sale.id
-        sale_data['vendor_id'] = sale.vendor_id
-        sale_data['customer_name'] = sale.customer_name
-        sale_data['product_name'] = sale.product_name
-        sale_data['quantity'] = sale.quantity
-        sale_data['total_price'] = str(sale.total_price)
-        sale_data['status'] = sale.status
-        output.append(sale_data)
+@api.route('/get_vendor_sales', methods=['GET'])
+@role_required('vendor', message='Only vendors can view their sales')
+def get_vendor_sales():
+    """
+    Get a page of the current vendor's sales, newest first
+    ---
+    security:
+      - JWT: []
+    parameters:
+      - in: query
+        name: format
+        type: string
+        required: false
+        enum: ['rows', 'columns']
+        description: "rows (default) for one object per row, or columns for {columns: [...], rows: [[...]]}"
+      - in: query
+        name: status
+        type: string
+        required: false
+        enum: ['Processing', 'Shipped']
+        description: Only return sales with this status
+      - in: query
+        name: start_date
+        type: string
+        required: false
+        description: Only return sales made at or after this ISO 8601 date/time
+      - in: query
+        name: end_date
+        type: string
+        required: false
+        description: Only return sales made before this ISO 8601 date/time
+      - in: query
+        name: after_id
+        type: integer
+        required: false
+        description: Return sales older than this sale ID
+      - in: query
+        name: limit
+        type: integer
+        required: false
+        description: Maximum number of sales to return (default 50, max 200)
+    responses:
+      200:
+        description: A page of the vendor's sales
+        schema:
+          type: object
+          properties:
+            sales:
+              type: array
+              items:
+                type: object
+                description: A sale, in the same format as /get_sales
+            next_after_id:
+              type: integer
+              description: Cursor to pass as after_id for the next page, or null on the last page
+      400:
+        description: Invalid filter or pagination parameter
+      403:
+        description: The current user is not a vendor
+    """
+    # Get the vendor's ID from the JWT
+    vendor_id = get_jwt_identity()
 
-    print(output)
+    try:
+        output, next_after_id = get_vendor_sales_page(vendor_id, request.args)
+        sales = list_payload(output, request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-    return jsonify({'sales': output})
+    return jsonify({'sales': sales, 'next_after_id': next_after_id}), 200
 
-@app.route('/change_status_to_shipping/<int:sale_id>', methods=['POST'])
+@api.route('/change_status_to_shipping/<int:sale_id>', methods=['POST'])
 @jwt_required()
 def change_status_to_shipping(sale_id):
     """
@@ -791,19 +2315,94 @@ def change_status_to_shipping(sale_id):
     if sale is None:
         return jsonify({'error': 'Sale not found'}), 404
 
+    # Change the sale's status to "Shipped" and update the vendor's sales stats
+    outcome = ship_sales(sale.vendor_id, [sale_id])[sale_id]
+
     # If the sale has already been shipped, return an error message
-    if sale.status == 'Shipped':
+    if outcome != 'shipped':
         return jsonify({'error': 'Sale is already in shipping status'}), 400
 
-    # Change the sale's status to "Shipped"
-    sale.status = 'Shipped'
-    # Commit the changes to the database
-    db.session.commit()
-
     return jsonify({'success': True, 'message': 'Sale status changed to shipping'}), 200
 
+@api.route('/bulk_change_status_to_shipping', methods=['POST'])
+@role_required('vendor', message='Only vendors can ship sales')
+def bulk_change_status_to_shipping():
+    """
+    Change the status of many of the current vendor's sales to "Shipped"
+    ---
+    security:
+      - JWT: []
+    parameters:
+      - in: body
+        name: body
+        required: true
+        description: Either saleIds, or a date range (startDate, endDate or both) selecting all of the vendor's Processing sales
+        schema:
+          type: object
+          properties:
+            saleIds:
+              type: array
+              items:
+                type: integer
+              description: IDs of the sales to ship (at most 1000)
+              example: [1, 2, 3]
+            startDate:
+              type: string
+              description: Without saleIds, ship Processing sales made at or after this ISO 8601 date/time
+            endDate:
+              type: string
+              description: Without saleIds, ship Processing sales made before this ISO 8601 date/time
+    responses:
+      200:
+        description: The outcome for each sale
+        schema:
+          type: object
+          properties:
+            shipped:
+              type: integer
+              description: Number of sales moved to Shipped
+            results:
+              type: array
+              items:
+                type: object
+                properties:
+                  id:
+                    type: integer
+                    description: The ID of the sale
+                  result:
+                    type: string
+                    enum: ['shipped', 'already_shipped', 'forbidden', 'not_found']
+                    description: What happened to the sale
+      400:
+        description: Neither saleIds nor a date given, or invalid sale IDs or date range
+      403:
+        description: The current user is not a vendor
+    """
+    # Get the vendor's ID from the JWT
+    vendor_id = get_jwt_identity()
+
+    data = request.get_json() or {}
+    sale_ids = data.get('saleIds')
+    if sale_ids is not None:
+        if not isinstance(sale_ids, list) or not all(isinstance(sale_id, int) for sale_id in sale_ids):
+            return jsonify({'error': 'saleIds must be a list of integers'}), 400
+        if len(sale_ids) > MAX_BULK_SHIP_IDS:
+            return jsonify({'error': f'At most {MAX_BULK_SHIP_IDS} sales can be shipped at once'}), 400
+        # Drop duplicates but keep the caller's order
+        sale_ids = list(dict.fromkeys(sale_ids))
+
+    try:
+        outcomes = ship_sales(vendor_id, sale_ids, data.get('startDate'), data.get('endDate'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({
+        'shipped': sum(1 for result in outcomes.values() if result == 'shipped'),
+        'results': [{'id': sale_id, 'result': result} for sale_id, result in outcomes.items()]
+    }), 200
+
 # Endpoint to get a user's orders
-@app.route('/get_orders', methods=['GET'])
+@api.route('/get_orders', methods=['GET'])
 @jwt_required()
 def get_orders():
     """
@@ -811,6 +2410,13 @@ def get_orders():
     ---
     security:
       - JWT: []
+    parameters:
+      - in: query
+        name: format
+        type: string
+        required: false
+        enum: ['rows', 'columns']
+        description: "rows (default) for one object per row, or columns for {columns: [...], rows: [[...]]}"
     responses:
       200:
         description: List of user's orders
@@ -843,47 +2449,77 @@ def get_orders():
                   status:
                     type: string
                     description: The status of the order
+      400:
+        description: Unknown format
     """
     # Get the user's ID from the JWT
-    user_id = get_jwt_identity() 
-    # Query the database for the user
-    user = User.query.get(user_id)
-    if user is None:
-        return jsonify({'error': 'User not found'}), 404
-
-    # Query the database for the user's orders
-    orders = Sale.query.filter_by(customer_name=user.username).all() 
-    output = []
+    user_id = get_jwt_identity()
 
-    # Iterate through the orders
-    for order in orders:
-        # Append each order's data to the output list
-        order_data = {}
-        order_data['id'] = order.id
-        # Get vendor for the order
-        vendor = User.query.get(order.vendor_id)
-        if vendor is None:
-            order_data['vendor_name'] = 'Vendor not found'
-        else:
-            order_data['vendor_name'] = vendor.vendor_name
-        order_data['vendor_id'] = order.vendor_id
-        order_data['product_name'] = order.product_name
-        order_data['quantity'] = order.quantity
-        order_data['total_price'] = str(order.total_price)
-        order_data['status'] = order.status
-        output.append(order_data)
+    output = get_customer_orders(user_id)
 
-    return jsonify({'orders': output})
+    # Return the orders in the requested format
+    try:
+        return jsonify({'orders': list_payload(output, request.args)})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
 
-@app.route('/get_products', methods=['GET'])
+@api.route('/get_products', methods=['GET'])
 def get_vendor_products():
     """
-    Get all products
+    Get a page of products
     ---
+    parameters:
+      - in: query
+        name: format
+        type: string
+        required: false
+        enum: ['rows', 'columns']
+        description: "rows (default) for one object per row, or columns for {columns: [...], rows: [[...]]}"
+      - in: query
+        name: after_id
+        type: integer
+        required: false
+        description: Return products that come after this product ID in the chosen sort order
+      - in: query
+        name: after_value
+        type: string
+        required: false
+        description: The next_after_value that came with after_id, for the price and name sorts
+      - in: query
+        name: limit
+        type: integer
+        required: false
+        description: Maximum number of products to return (default 50, max 200)
+      - in: query
+        name: vendor_id
+        type: integer
+        required: false
+        description: Only return products from this vendor
+      - in: query
+        name: min_price
+        type: number
+        required: false
+        description: Only return products at or above this price
+      - in: query
+        name: max_price
+        type: number
+        required: false
+        description: Only return products at or below this price
+      - in: query
+        name: sort
+        type: string
+        required: false
+        enum: ['id', 'price', '-price', 'name']
+        description: Sort order of the listing (default id)
+      - in: header
+        name: If-None-Match
+        type: string
+        required: false
+        description: ETag of a previous response; answered with 304 if the catalog has not changed
     responses:
       200:
-        description: List of all products
+        description: A page of products
         schema:
           type: object
           properties:
@@ -910,26 +2546,22 @@ def get_vendor_products():
                   vendor_name:
                     type: string
                     description: The name of the vendor
+            next_after_id:
+              type: integer
+              description: Cursor to pass as after_id for the next page, or null on the last page
+            next_after_value:
+              type: string
+              description: "Price and name sorts only: sort value to pass as after_value with after_id"
+      304:
+        description: The catalog has not changed since the version named in If-None-Match
+      400:
+        description: Invalid pagination or filter parameter
     """
-    # Query all products from the database
-    products = Product.query.all()
-    output = []
-    for product in products:
-        # Construct a dictionary for each product
-        product_data = {}
-        product_data['id'] = product.id
-        product_data['name'] = product.name
-        product_data['price'] = product.price
-        product_data['description'] = product.description
-        product_data['vendor_id'] = product.vendor_id
-        product_data['vendor_name'] = product.vendor_name
-        # Append each product to the output list
-        output.append(product_data)
-    # Return the list of products as a JSON response
-    return jsonify({'products': output})
+    # Serve the page, or 304 if the client's copy is still current
+    return catalog_listing_response()
 
 # Route to update a product's information
-@app.route('/update-product/<int:product_id>', methods=['PUT'])
+@api.route('/update-product/<int:product_id>', methods=['PUT'])
 @jwt_required()
 def update_product(product_id):
     """
@@ -961,6 +2593,8 @@ def update_product(product_id):
     responses:
       200:
         description: Product updated successfully
+      400:
+        description: Invalid price
       403:
         description: Unauthorized to update this product
       404:
@@ -986,18 +2620,26 @@ def update_product(product_id):
     if 'name' in data:
         product.name = data['name']
     if 'price' in data:
-        product.price = data['price']
+        # Prices are stored in integer cents
+        try:
+            product.price_cents = parse_cents(data['price'], 'price')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
     if 'description' in data:
         product.description = data['description']
+    # Give the product a new version so that cached copies stop matching its ETag
+    product.version = bump_catalog_version()
 
     # Commit the changes to the database
     db.session.commit()
+    # Drop the cached copy of the product and the listings that contain it
+    product_cache.invalidate_product(product.id, product.vendor_id)
 
     # Return a success message
     return jsonify({'message': 'Product updated'}), 200
 
 # Route to get a specific product by its ID
-@app.route('/get_product/<int:productId>', methods=['GET'])
+@api.route('/get_product/<int:productId>', methods=['GET'])
 def get_product(productId):
     """
     Get a specific product by ID
@@ -1008,6 +2650,11 @@ def get_product(productId):
         required: true
         type: integer
         description: The ID of the product to retrieve
+      - in: header
+        name: If-None-Match
+        type: string
+        required: false
+        description: ETag of a previous response; answered with 304 if the product has not changed
     responses:
       200:
         description: The requested product
@@ -1035,29 +2682,31 @@ def get_product(productId):
                 vendor_name:
                   type: string
                   description: The name of the vendor
+      304:
+        description: The product has not changed since the version named in If-None-Match
       404:
         description: Product not found
     """
-    # Query the database for the product using the provided ID
-    product = Product.query.get(productId)
-    if product is None:
+    # Look up only the product's version, which is all a revalidation needs
+    version = db.session.scalar(select(Product.version).where(Product.id == productId))
+    if version is None:
         # If no product was found with the provided ID, return an error
         return jsonify({'error': 'Product not found'}), 404
 
-    # Otherwise, create a dictionary with the product's data
-    product_data = {}
-    product_data['id'] = product.id
-    product_data['name'] = product.name
-    product_data['price'] = product.price
-    product_data['description'] = product.description
-    product_data['vendor_id'] = product.vendor_id
-    product_data['vendor_name'] = product.vendor_name
+    def build_product():
+        product_data = get_product_details(productId, version)
+        if product_data is None:
+            # Deleted since its version was read
+            return jsonify({'error': 'Product not found'}), 404
 
-    # Return the product data as a JSON response
-    return jsonify({'product': product_data}), 200
+        # Return the product data as a JSON response
+        return jsonify({'product': product_data}), 200
+
+    # Answer 304 if the client already has this version
+    return conditional_response(f'product-{productId}-{version}', build_product)
 
 # Route to get a specific order by its ID
-@app.route('/get_order/<int:orderId>', methods=['GET'])
+@api.route('/get_order/<int:orderId>', methods=['GET'])
 def get_order(orderId):
     """
     Get a specific order by ID
@@ -1110,14 +2759,14 @@ def get_order(orderId):
     order_data['product_name'] = order.product_name
     order_data['customer_name'] = order.customer_name
     order_data['quantity'] = order.quantity
-    order_data['total_price'] = order.total_price
+    order_data['total_price'] = format_cents(order.total_price_cents)
     order_data['status'] = order.status
 
     # Return the order data as a JSON response
     return jsonify({'order': order_data}), 200
 
 # Route to delete a product by its ID
-@app.route('/delete-product/<int:product_id>', methods=['DELETE'])
+@api.route('/delete-product/<int:product_id>', methods=['DELETE'])
 @jwt_required()
 def delete_product(product_id):
     """
@@ -1153,19 +2802,214 @@ def delete_product(product_id):
     if product.vendor_id != current_vendor_id:
         return jsonify({'error': 'You do not have permission to delete this product'}), 403
 
-    # Delete the product from the database
+    # Delete the product from the database, with the cart lines holding it. Its
+    # sales keep their name snapshot but lose the id, which SQLite may give to
+    # the next product created.
+    db.session.execute(delete(ShoppingCartItem).where(ShoppingCartItem.product_id == product_id))
+    db.session.execute(update(Sale).where(Sale.product_id == product_id).values(product_id=None))
+    forget_product_stats(product_id)
     db.session.delete(product)
+    bump_catalog_version()
     db.session.commit()
+    # Drop the cached copy of the product and the listings that contain it
+    product_cache.invalidate_product(product_id, current_vendor_id)
 
     # Return a success message
     return jsonify({'message': 'Product deleted'}), 200
 
 
+# Route to inspect the product cache
+@api.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    """
+    Get product cache statistics
+    ---
+    responses:
+      200:
+        description: Counters for sizing the product cache
+        schema:
+          type: object
+          properties:
+            hits:
+              type: integer
+              description: Lookups answered from the cache
+            misses:
+              type: integer
+              description: Lookups that had to query the database
+            evictions:
+              type: integer
+              description: Entries dropped because the cache was full
+            expirations:
+              type: integer
+              description: Entries dropped because their TTL ran out
+            size:
+              type: integer
+              description: Number of entries currently cached
+            maxsize:
+              type: integer
+              description: Maximum number of entries
+            ttl:
+              type: integer
+              description: Time to live of an entry in seconds
+    """
+    return jsonify(product_cache.stats()), 200
+
+
+@api.cli.command('rebuild-vendor-stats')
+def rebuild_vendor_stats_command():
+    """Rebuild the vendor sales stats from the sales table."""
+    rows = rebuild_vendor_stats()
+    click.echo(f'Rebuilt vendor sales stats: {rows} rows')
+
+
+@api.cli.command('export-api-spec')
+@click.argument('path', type=click.Path(dir_okay=False))
+def export_api_spec_command(path):
+    """Write the OpenAPI spec of the routes to path, to be served through API_SPEC_FILE."""
+    spec = build_api_spec(current_app._get_current_object())
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(current_app.json.dumps(spec))
+    click.echo(f'Wrote the API spec to {path}')
+
+
+# Route to inspect the background maintenance jobs
+@api.route('/maintenance-status', methods=['GET'])
+def maintenance_status():
+    """
+    Get the state of the background maintenance jobs
+    ---
+    responses:
+      200:
+        description: When each job last ran, how long it took and how many rows it affected
+        schema:
+          type: object
+          properties:
+            enabled:
+              type: boolean
+              description: Whether the scheduler runs in this process
+            active:
+              type: boolean
+              description: Whether this process runs the jobs; only the one holding MAINTENANCE_LOCK_FILE does
+            jobs:
+              type: array
+              items:
+                type: object
+                properties:
+                  name:
+                    type: string
+                    description: expire_cart_items, optimize_database or checkpoint_wal
+                  interval_seconds:
+                    type: integer
+                    description: Time between runs
+                  runs:
+                    type: integer
+                    description: Number of runs since the process started
+                  failures:
+                    type: integer
+                    description: Number of runs that raised an error
+                  last_started_at:
+                    type: string
+                    description: UTC start time of the last run
+                  last_duration_seconds:
+                    type: number
+                    description: Run time of the last run
+                  last_rows_affected:
+                    type: integer
+                    description: Rows deleted (cart expiry) or pages checkpointed (WAL), null if not applicable
+                  total_rows_affected:
+                    type: integer
+                    description: Sum of last_rows_affected over all runs
+                  last_error:
+                    type: string
+                    description: Error raised by the last run, if any
+                  next_run_in_seconds:
+                    type: number
+                    description: Time until the next run, null if the scheduler is not running
+    """
+    return jsonify({'enabled': config.MAINTENANCE_ENABLED, 'active': maintenance.active,
+                    'jobs': maintenance.status()}), 200
+
+
+@api.cli.command('run-maintenance')
+@click.argument('job', required=False)
+def run_maintenance_command(job):
+    """Run one maintenance job, or all of them, once."""
+    for status in maintenance.status():
+        if job is None or status['name'] == job:
+            rows = maintenance.run_job(status['name'])
+            click.echo(f"{status['name']}: {rows if rows is not None else '-'}")
+
+
+# Route to scrape the request metrics
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Get request metrics in the Prometheus text format
+    ---
+    produces:
+      - text/plain
+    responses:
+      200:
+        description: >
+          Per-endpoint histograms of latency, SQL statements, SQL time and
+          response size, plus request and slow request counters, for this process
+    """
+    return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+def build_app():
+    """
+    Return a new app serving the API.
+
+    Configures the extensions, registers the routes and request hooks and,
+    unless API_DOCS_ENABLED is off, the API docs. Touches neither the database
+    schema nor the maintenance scheduler.
+    """
+    app = Flask(__name__)
+    CORS(app, resources={r'/*': {'origins': config.CORS_ORIGINS}})
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = config.DATABASE_URL
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = config.engine_options()
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['JWT_SECRET_KEY'] = 'your_secret_key'  # Replace with a secure secret key
+
+    jwt.init_app(app)
+    db.init_app(app)
+    with app.app_context():
+        install_sqlite_pragmas(db.engine)
+        install_request_metrics(app, db.engine, request_metrics)
+    # Installed after the metrics so that they record the compressed size
+    install_response_compression(app, min_size=config.COMPRESSION_MIN_SIZE, gzip_level=config.GZIP_LEVEL,
+                                 brotli_quality=config.BROTLI_QUALITY)
+    app.register_blueprint(api)
+    if config.API_DOCS_ENABLED:
+        install_api_docs(app, spec_file=config.API_SPEC_FILE)
+    maintenance.context = app.app_context
+    return app
+
+
+def create_app():
+    """
+    Application factory for the production WSGI server (see wsgi.py).
+
+    Builds the app, brings the database schema up to date, starts the
+    maintenance scheduler and returns the app.
+    """
+    app = build_app()
+    with app.app_context():
+        upgrade(db.engine, db.metadata)
+    if config.MAINTENANCE_ENABLED:
+        maintenance.start()
+    return app
+
 
 if __name__ == '__main__':
+    app = build_app()
     with app.app_context():
-        # Only uncomment this line if you want to recreate/update the database. After running once, comment it out again so you don't lose your data!
+        # Only uncomment this line if you want to wipe the database. Schema changes are applied by upgrade() below, so this is not needed to update it!
         # db.drop_all()
-        db.create_all()
+        upgrade(db.engine, db.metadata)
+    # The debug reloader runs this file twice; only the process that serves requests runs maintenance
+    if config.MAINTENANCE_ENABLED and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        maintenance.start()
     app.run(debug=True)
-
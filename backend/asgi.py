@@ -0,0 +1,8 @@
+"""
+ASGI entry point for the async read API (see async_api.py):
+
+    uvicorn --workers 4 --port 5001 asgi:app
+
+The threaded server (wsgi.py) still serves every other endpoint.
+"""
+from async_api import application as app
@@ -0,0 +1,298 @@
+"""
+Asyncio serving path for the read-heavy endpoints.
+
+The Flask app handles each request on a thread that blocks while it waits on
+the database, so a worker serves at most WEB_THREADS requests at a time. This
+module serves the hottest reads from a single event loop per process instead:
+
+* ``GET /products`` and ``GET /get_products``
+* ``GET /get_product/<id>``
+* ``GET /api/shopping_cart``
+* ``GET /get_orders``
+
+It is a plain ASGI application (see asgi.py) on an async SQLAlchemy engine
+(aiosqlite for SQLite). The queries and serialization are the app's own
+helpers, run through ``AsyncSession.run_sync``: they execute on the event
+loop and yield to other requests whenever they wait on the database, so the
+JSON each endpoint returns, its ETags, the ``format`` argument and the errors
+are the same as the Flask routes'. Access tokens are checked as
+``@jwt_required()`` does, with the same secret and error messages.
+
+Revocations made through ``POST /logout`` live in the process that handled
+them (see tokens.py) and do not reach this server. Requests here are not
+counted in ``/metrics``.
+
+Every other endpoint stays on the threaded server; route these paths to this
+server in the reverse proxy.
+"""
+import logging
+import re
+from collections import namedtuple
+from urllib.parse import parse_qsl
+
+import jwt
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import parse_accept_header, parse_etags, quote_etag
+
+import config
+from app import (build_app, db, catalog_version, get_cart_items, get_customer_orders, get_product_details,
+                 get_product_page, list_payload, product_cache, token_denylist, MAX_ID, Product)
+from compression import compress, supported_encodings
+from database import install_sqlite_pragmas
+from migrations import upgrade
+
+# For its configuration, JSON provider and the app context of the schema upgrade; it serves no requests here
+flask_app = build_app()
+
+# Async driver for each database the app supports
+ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg'}
+
+Request = namedtuple('Request', 'method path args headers')
+
+log = logging.getLogger('async_api')
+
+
+class HTTPError(Exception):
+    def __init__(self, status, payload):
+        super().__init__(status)
+        self.status = status
+        self.payload = payload
+
+
+class Response:
+    def __init__(self, body=b'', status=200, headers=None):
+        self.body = body
+        self.status = status
+        self.headers = dict(headers or {})
+
+
+def async_database_url(url):
+    """Return url with the async driver of its database."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f'No async driver configured for {backend} databases')
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+def engine_options():
+    options = config.engine_options()
+    if options:
+        # aiosqlite defaults to opening a connection per session; keep them pooled as the sync engine does
+        options.update(poolclass=AsyncAdaptedQueuePool, pool_size=config.ASYNC_DB_POOL_SIZE,
+                       max_overflow=config.ASYNC_DB_POOL_SIZE)
+    return options
+
+
+engine = create_async_engine(async_database_url(config.DATABASE_URL), **engine_options())
+install_sqlite_pragmas(engine.sync_engine)
+Session = async_sessionmaker(engine, expire_on_commit=False)
+
+
+def json_response(payload, status=200):
+    # Serialized exactly as jsonify() does outside debug mode
+    body = flask_app.json.dumps(payload, separators=(',', ':')) + '\n'
+    return Response(body.encode('utf-8'), status, {'Content-Type': 'application/json'})
+
+
+def conditional(request, etag, build_response):
+    """Answer 304 if the request's If-None-Match names etag; otherwise build the response and tag it."""
+    if parse_etags(request.headers.get('if-none-match')).contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = build_response()
+        if response.status != 200:
+            return response
+    response.headers['ETag'] = quote_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def token_identity(request):
+    """Return the identity of the request's access token, checked as @jwt_required() checks it."""
+    header = request.headers.get('authorization', '').strip().strip(',')
+    if not header:
+        raise HTTPError(401, {'msg': 'Missing Authorization Header'})
+    # The header may list several comma separated credentials; exactly one must be a bearer token
+    bearer = [value for value in re.split(r',\s*', header) if value.split()[:1] == ['Bearer']]
+    if len(bearer) != 1:
+        raise HTTPError(401, {'msg': "Missing 'Bearer' type in 'Authorization' header. "
+                                     "Expected 'Authorization: Bearer <JWT>'"})
+    parts = bearer[0].split()
+    if len(parts) != 2:
+        raise HTTPError(422, {'msg': "Bad Authorization header. Expected 'Authorization: Bearer <JWT>'"})
+    token = parts[1]
+    try:
+        claims = jwt.decode(token, flask_app.config['JWT_SECRET_KEY'],
+                            algorithms=[flask_app.config['JWT_ALGORITHM']])
+    except jwt.ExpiredSignatureError:
+        raise HTTPError(401, {'msg': 'Token has expired'})
+    except jwt.InvalidTokenError as e:
+        raise HTTPError(422, {'msg': str(e)})
+    if claims.get('type') != 'access':
+        raise HTTPError(422, {'msg': 'Only non-refresh tokens are allowed'})
+    if token_denylist.contains(claims.get('jti')):
+        raise HTTPError(401, {'msg': 'Token has been revoked'})
+    return claims[flask_app.config['JWT_IDENTITY_CLAIM']]
+
+
+async def get_all_products(request):
+    def load(session):
+        # Same steps as catalog_listing_response(), on this session
+        version = catalog_version(session)
+
+        def build_page():
+            try:
+                output, cursor = product_cache.get_or_load(
+                    product_cache.listing_key(request.args, version), lambda: get_product_page(request.args, session))
+                products = list_payload(output, request.args)
+            except ValueError as e:
+                return json_response({'error': str(e)}, 400)
+            return json_response({'products': products, **cursor})
+
+        return conditional(request, f'catalog-{version}', build_page)
+
+    async with Session() as session:
+        return await session.run_sync(load)
+
+
+async def get_product(request, product_id):
+    product_id = int(product_id)
+    if product_id > MAX_ID:
+        # Too large for the database driver to bind
+        return json_response({'error': 'Product not found'}, 404)
+
+    def load(session):
+        version = session.scalar(select(Product.version).where(Product.id == product_id))
+        if version is None:
+            return json_response({'error': 'Product not found'}, 404)
+
+        def build_product():
+            product_data = get_product_details(product_id, version, session)
+            if product_data is None:
+                return json_response({'error': 'Product not found'}, 404)
+            return json_response({'product': product_data})
+
+        return conditional(request, f'product-{product_id}-{version}', build_product)
+
+    async with Session() as session:
+        return await session.run_sync(load)
+
+
+async def get_user_cart_info(request):
+    user_id = token_identity(request)
+    async with Session() as session:
+        cart_items = await session.run_sync(lambda sync_session: get_cart_items(user_id, sync_session))
+    try:
+        return json_response({'cart': list_payload(cart_items, request.args)})
+    except ValueError as e:
+        return json_response({'error': str(e)}, 400)
+
+
+async def get_orders(request):
+    user_id = token_identity(request)
+    async with Session() as session:
+        output = await session.run_sync(lambda sync_session: get_customer_orders(user_id, sync_session))
+    try:
+        return json_response({'orders': list_payload(output, request.args)})
+    except ValueError as e:
+        return json_response({'error': str(e)}, 400)
+
+
+ROUTES = [
+    (re.compile(r'/products'), get_all_products),
+    (re.compile(r'/get_products'), get_all_products),
+    (re.compile(r'/get_product/(\d+)'), get_product),
+    (re.compile(r'/api/shopping_cart'), get_user_cart_info),
+    (re.compile(r'/get_orders'), get_orders),
+]
+
+
+async def dispatch(request):
+    for pattern, handler in ROUTES:
+        match = pattern.fullmatch(request.path)
+        if match is None:
+            continue
+        if request.method == 'OPTIONS':
+            return Response(status=200, headers=preflight_headers(request))
+        if request.method not in ('GET', 'HEAD'):
+            return json_response({'error': 'Method not allowed'}, 405)
+        try:
+            return await handler(request, *match.groups())
+        except HTTPError as e:
+            return json_response(e.payload, e.status)
+    return json_response({'error': 'Not found'}, 404)
+
+
+def preflight_headers(request):
+    headers = {'Access-Control-Allow-Methods': 'GET, HEAD, OPTIONS'}
+    requested = request.headers.get('access-control-request-headers')
+    if requested:
+        headers['Access-Control-Allow-Headers'] = requested
+    return headers
+
+
+def finish(request, response):
+    """Add the CORS and compression headers the Flask app would add."""
+    origin = request.headers.get('origin')
+    if origin in config.CORS_ORIGINS:
+        response.headers['Access-Control-Allow-Origin'] = origin
+        response.headers['Vary'] = 'Origin'
+    if response.headers.get('Content-Type') != 'application/json':
+        return response
+    response.headers['Vary'] = ', '.join(filter(None, [response.headers.get('Vary'), 'Accept-Encoding']))
+    if len(response.body) < config.COMPRESSION_MIN_SIZE:
+        return response
+    encoding = parse_accept_header(request.headers.get('accept-encoding')).best_match(supported_encodings())
+    if encoding is not None:
+        compressed = compress(response.body, encoding, config.GZIP_LEVEL, config.BROTLI_QUALITY)
+        if len(compressed) < len(response.body):
+            response.body = compressed
+            response.headers['Content-Encoding'] = encoding
+    return response
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # Queries below assume the current schema
+            with flask_app.app_context():
+                upgrade(db.engine, db.metadata)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await engine.dispose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    """The ASGI entry point."""
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    request = Request(
+        method=scope['method'],
+        path=scope['path'],
+        args=MultiDict(parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True)),
+        headers={name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+    )
+    try:
+        response = await dispatch(request)
+    except Exception:
+        # Answer in JSON, as the other errors are, rather than dropping the connection
+        log.exception('Exception on %s [%s]', request.path, request.method)
+        response = json_response({'error': 'Internal server error'}, 500)
+    response = finish(request, response)
+    headers = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in response.headers.items()]
+    if response.status != 304:
+        headers.append((b'content-length', str(len(response.body)).encode('latin-1')))
+    await send({'type': 'http.response.start', 'status': response.status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': b'' if request.method == 'HEAD' else response.body})
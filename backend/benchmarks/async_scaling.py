@@ -0,0 +1,137 @@
+"""
+Concurrency scaling of the async read API against the threaded server.
+
+Seeds a temporary database (as load_test.py does), then serves it with
+gunicorn (wsgi:app, gunicorn.conf.py) and with uvicorn (asgi:app) at the
+same number of worker processes. Each endpoint the async API serves is
+driven by an increasing number of concurrent keep-alive clients, all held
+open at once from a single event loop, so a thousand clients cost a
+thousand sockets rather than a thousand threads. Reports requests per
+second, p50/p99 latency and failed requests per server and client count.
+
+Raise the open file limit (ulimit -n) above the largest client count.
+
+Usage: python benchmarks/async_scaling.py [--workers 2] [--clients 100,1000,2000] [--duration 10]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import load_test
+from load_test import BACKEND_DIR, DATABASE_URL, free_port, seed
+
+
+def start_uvicorn(workers, port):
+    env = dict(os.environ, DATABASE_URL=DATABASE_URL)
+    server = subprocess.Popen([sys.executable, '-m', 'uvicorn', '--workers', str(workers), '--port', str(port),
+                               '--backlog', '4096', '--no-access-log', '--log-level', 'warning', 'asgi:app'],
+                              cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError('uvicorn did not start')
+
+
+async def fetch(reader, writer, request):
+    """Send one request on a keep-alive connection; return its status."""
+    writer.write(request)
+    head = await reader.readuntil(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    length = 0
+    for line in head.split(b'\r\n')[1:]:
+        name, _, value = line.partition(b':')
+        if name.strip().lower() == b'content-length':
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def run_load(port, path, headers, clients, duration):
+    """Hammer one endpoint from clients connections; return (requests per second, p50 ms, p99 ms, errors)."""
+    request = (f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n'
+               + ''.join(f'{name}: {value}\r\n' for name, value in headers.items()) + '\r\n').encode('latin-1')
+    latencies, errors = [], 0
+
+    async def connect():
+        try:
+            return await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port, limit=1 << 20), 30)
+        except (OSError, asyncio.TimeoutError):
+            return None
+
+    async def client(connection, deadline):
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            if connection is None:
+                connection = await connect()
+                if connection is None:
+                    errors += 1
+                    continue
+            start = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(fetch(*connection, request), 30)
+            except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+                errors += 1
+                connection[1].close()
+                connection = None
+                continue
+            if status != 200:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+        if connection is not None:
+            connection[1].close()
+
+    # Open every connection before the clock starts
+    connections = await asyncio.gather(*(connect() for _ in range(clients)))
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*(client(connection, deadline) for connection in connections))
+
+    latencies.sort()
+    if not latencies:
+        return 0, 0, 0, errors
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    return len(latencies) / duration, p50, p99, errors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=2, help='server processes for both servers')
+    parser.add_argument('--clients', default='100,1000,2000', help='comma separated concurrent client counts')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per endpoint and client count')
+    args = parser.parse_args()
+
+    token = seed()
+    auth = {'Authorization': f'Bearer {token}'}
+    endpoints = [
+        ('/products', {}),
+        ('/get_product/42', {}),
+        ('/api/shopping_cart', auth),
+        ('/get_orders', auth),
+    ]
+    servers = [('gunicorn', load_test.start_server), ('uvicorn', start_uvicorn)]
+
+    print(f"{'server':<9} {'clients':>7}  {'endpoint':<20} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>6}")
+    for name, start in servers:
+        port = free_port()
+        server = start(args.workers, port)
+        try:
+            for clients in (int(count) for count in args.clients.split(',')):
+                for path, headers in endpoints:
+                    rps, p50, p99, errors = asyncio.run(run_load(port, path, headers, clients, args.duration))
+                    print(f'{name:<9} {clients:>7}  {path:<20} {rps:>9.1f} {p50:>8.2f} {p99:>8.2f} {errors:>6}')
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Concurrent checkout stress benchmark.
+
+Many customer threads repeatedly add products from a small set of shared
+vendors to their carts and place orders at the same time. At the end, each
+vendor's stored revenue and its vendor sales stats, both as kept up to date
+by checkout and as rebuilt from the sales, must equal the sum of its Sale
+rows and the amount the benchmark expects, to the cent. This catches lost
+read-modify-write updates.
+
+Usage: python benchmarks/checkout_stress.py [--customers 16] [--rounds 20]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# Point the app at a temporary database before it is imported
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'checkout_stress.sqlite3')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func
+
+from app import build_app, db, access_token_for, rebuild_vendor_stats, User, Product, Sale, VendorSalesStat
+from money import format_cents
+
+app = build_app()
+
+VENDOR_COUNT = 3
+PRODUCTS_PER_VENDOR = 4
+
+
+def seed(customers):
+    db.drop_all()
+    db.create_all()
+    vendors = [User(username=f'vendor{i}', password='x', user_type='vendor',
+                    vendor_name=f'Vendor {i}', vendor_revenue_cents=0) for i in range(VENDOR_COUNT)]
+    db.session.add_all(vendors)
+    db.session.flush()
+    products = []
+    for vendor in vendors:
+        for i in range(PRODUCTS_PER_VENDOR):
+            products.append(Product(name=f'{vendor.username}-item{i}', price_cents=125 + 100 * i,
+                                    vendor_id=vendor.id, vendor_name=vendor.vendor_name))
+    users = [User(username=f'customer{i}', password='x', user_type='normal') for i in range(customers)]
+    db.session.add_all(products + users)
+    db.session.commit()
+    return [(p.id, p.vendor_id, p.price_cents) for p in products], [u.id for u in users]
+
+
+def customer(user_id, products, rounds, expected, lock, errors):
+    client = app.test_client()
+    with app.app_context():
+        headers = {'Authorization': 'Bearer ' + access_token_for(User.query.get(user_id))}
+    for round_number in range(rounds):
+        cart = products[(user_id + round_number) % len(products):][:5] or products[:5]
+        for product_id, _, _ in cart:
+            client.post('/add-to-cart', json={'productId': product_id, 'quantity': 2}, headers=headers)
+        response = client.post('/place-order', headers=headers)
+        if response.status_code != 200:
+            errors.append(response.status_code)
+            continue
+        with lock:
+            for _, vendor_id, price_cents in cart:
+                expected[vendor_id] = expected.get(vendor_id, 0) + price_cents * 2
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--customers', type=int, default=16)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    with app.app_context():
+        products, user_ids = seed(args.customers)
+
+    expected, errors, lock = {}, [], threading.Lock()
+    threads = [threading.Thread(target=customer, args=(user_id, products, args.rounds, expected, lock, errors))
+               for user_id in user_ids]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    checkouts = args.customers * args.rounds - len(errors)
+    print(f'{checkouts} checkouts by {args.customers} threads in {elapsed:.2f}s '
+          f'({checkouts / elapsed:.1f}/s), {len(errors)} failed')
+
+    ok = True
+    with app.app_context():
+        def stats_revenue():
+            return dict(db.session.query(VendorSalesStat.vendor_id, func.sum(VendorSalesStat.revenue_cents))
+                        .group_by(VendorSalesStat.vendor_id).all())
+
+        from_stats = stats_revenue()
+        rebuild_vendor_stats()
+        rebuilt = stats_revenue()
+        from_sales = dict(db.session.query(Sale.vendor_id, func.sum(Sale.total_price_cents))
+                          .group_by(Sale.vendor_id).all())
+        for vendor in User.query.filter_by(user_type='vendor').order_by(User.id):
+            amounts = [vendor.vendor_revenue_cents, from_sales.get(vendor.id, 0), from_stats.get(vendor.id, 0),
+                       rebuilt.get(vendor.id, 0), expected.get(vendor.id, 0)]
+            match = len(set(amounts)) == 1
+            ok &= match
+            print(f'{vendor.vendor_name}: ' + '  '.join(
+                f'{label} {format_cents(amount)}'
+                for label, amount in zip(('stored', 'sales', 'stats', 'rebuilt', 'expected'), amounts))
+                  + ('' if match else '  <-- MISMATCH'))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
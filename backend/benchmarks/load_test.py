@@ -0,0 +1,148 @@
+"""
+HTTP load test for the production server at several worker counts.
+
+Seeds a temporary database, starts gunicorn (gunicorn.conf.py) once per
+worker count, and drives the main read endpoints from concurrent keep-alive
+clients. Reports requests per second and p50/p99 latency per endpoint.
+
+Usage: python benchmarks/load_test.py [--workers 1,2,4] [--clients 32] [--duration 10]
+"""
+import argparse
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Point the app at a temporary database before it is imported
+DATABASE_URL = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'load_test.sqlite3')
+os.environ['DATABASE_URL'] = DATABASE_URL
+sys.path.insert(0, BACKEND_DIR)
+
+from app import db, create_app, access_token_for, User, Product, Sale, ShoppingCartItem
+
+# Build the schema the way the server does, so its start-up finds nothing to migrate
+app = create_app()
+
+
+def seed(products=2000, cart_items=20, orders=50):
+    """Create a catalog plus one customer with a cart and order history; return the customer's token."""
+    with app.app_context():
+        vendors = [User(username=f'vendor{i}', password='x', user_type='vendor',
+                        vendor_name=f'Vendor {i}', vendor_revenue_cents=0) for i in range(10)]
+        customer = User(username='customer', password='x', user_type='normal')
+        db.session.add_all(vendors + [customer])
+        db.session.flush()
+        db.session.add_all(Product(name=f'product{i}', price_cents=(1 + i % 50) * 100, description='A product ' * 10,
+                                   vendor_id=vendors[i % 10].id, vendor_name=vendors[i % 10].vendor_name)
+                           for i in range(products))
+        db.session.flush()
+        db.session.add_all(ShoppingCartItem(user_id=customer.id, product_id=i + 1, quantity=1)
+                           for i in range(cart_items))
+        db.session.add_all(Sale(vendor_id=vendors[i % 10].id, customer_id=customer.id,
+                                customer_name=customer.username, product_name=f'product{i}',
+                                quantity=1, total_price_cents=100)
+                           for i in range(orders))
+        db.session.commit()
+        return access_token_for(customer)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workers, port):
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), BIND=f'127.0.0.1:{port}', DATABASE_URL=DATABASE_URL)
+    server = subprocess.Popen(['gunicorn', '-c', 'gunicorn.conf.py', '--access-logfile', os.devnull, 'wsgi:app'],
+                              cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError('gunicorn did not start')
+
+
+def run_load(port, path, headers, clients, duration):
+    """Hammer one endpoint; return (requests per second, p50 ms, p99 ms, errors)."""
+    latencies, errors = [], []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client():
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        local, failed = [], 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                if response.status != 200:
+                    failed += 1
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                continue
+            local.append(time.perf_counter() - start)
+        connection.close()
+        with lock:
+            latencies.extend(local)
+            errors.append(failed)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    if not latencies:
+        return 0, 0, 0, sum(errors)
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    return len(latencies) / duration, p50, p99, sum(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', default='1,2,4', help='comma separated worker counts')
+    parser.add_argument('--clients', type=int, default=32, help='concurrent client connections')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per endpoint')
+    args = parser.parse_args()
+
+    token = seed()
+    auth = {'Authorization': f'Bearer {token}'}
+    endpoints = [
+        ('/products', {}),
+        ('/get_product/42', {}),
+        ('/api/shopping_cart', auth),
+        ('/get_orders', auth),
+    ]
+
+    print(f"{'workers':>7}  {'endpoint':<20} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>6}")
+    for workers in (int(count) for count in args.workers.split(',')):
+        port = free_port()
+        server = start_server(workers, port)
+        try:
+            for path, headers in endpoints:
+                rps, p50, p99, errors = run_load(port, path, headers, args.clients, args.duration)
+                print(f'{workers:>7}  {path:<20} {rps:>9.1f} {p50:>8.2f} {p99:>8.2f} {errors:>6}')
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
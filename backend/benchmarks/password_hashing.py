@@ -0,0 +1,74 @@
+"""
+Password hashing throughput per hashing setting.
+
+Times PasswordPolicy.hash() for a range of scrypt and PBKDF2 work factors (and
+the original single-round sha256 hash for reference), on one thread and on
+several threads at once. Use it to pick the strongest setting whose per-hash
+time still fits the login latency budget; login costs one verify, which takes
+as long as one hash.
+
+Usage: python benchmarks/password_hashing.py [--threads 4] [--duration 2]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.security import generate_password_hash
+
+from passwords import PasswordPolicy
+
+SETTINGS = [
+    ('sha256 (original)', None),
+    ('pbkdf2 100000', PasswordPolicy(method='pbkdf2', pbkdf2_iterations=100000)),
+    ('pbkdf2 300000', PasswordPolicy(method='pbkdf2', pbkdf2_iterations=300000)),
+    ('pbkdf2 600000', PasswordPolicy(method='pbkdf2', pbkdf2_iterations=600000)),
+    ('scrypt n=2^13', PasswordPolicy(method='scrypt', scrypt_n=2 ** 13)),
+    ('scrypt n=2^14', PasswordPolicy(method='scrypt', scrypt_n=2 ** 14)),
+    ('scrypt n=2^15', PasswordPolicy(method='scrypt', scrypt_n=2 ** 15)),
+    ('scrypt n=2^16', PasswordPolicy(method='scrypt', scrypt_n=2 ** 16)),
+]
+
+
+def hashes_per_second(policy, threads, duration):
+    """Hash from the given number of threads for duration seconds; return total hashes/s."""
+    hash_password = policy.hash if policy else lambda password: generate_password_hash(password, method='sha256')
+    counts = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        done = 0
+        while time.perf_counter() < deadline:
+            hash_password('correct horse battery staple')
+            done += 1
+        with lock:
+            counts.append(done)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return sum(counts) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=os.cpu_count() or 1, help='threads for the parallel run')
+    parser.add_argument('--duration', type=float, default=2, help='seconds per measurement')
+    args = parser.parse_args()
+
+    print(f"{'setting':<18} {'ms/hash':>9} {'hashes/s':>10} {f'{args.threads} threads':>12}")
+    for label, policy in SETTINGS:
+        single = hashes_per_second(policy, 1, args.duration)
+        parallel = hashes_per_second(policy, args.threads, args.duration)
+        print(f'{label:<18} {1000 / single:>9.2f} {single:>10.1f} {parallel:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
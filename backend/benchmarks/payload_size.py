@@ -0,0 +1,109 @@
+"""
+Bytes on the wire and serialization time of the list endpoints.
+
+Fills a throwaway database with a vendor's catalog, a customer's cart and
+their orders, then fetches each list endpoint in both list formats (?format=rows,
+the default, and ?format=columns) with every response encoding the server
+offers. Reports the response size per encoding, the time to serialize the
+payload to JSON and the time to compress it.
+
+Usage: python benchmarks/payload_size.py [--rows 200] [--repeat 50]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Point the app at a temporary database before it is imported
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'payload_size.sqlite3')
+os.environ['MAINTENANCE_ENABLED'] = '0'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert
+
+import config
+from app import db, create_app, access_token_for, User, Product
+from compression import compress, supported_encodings
+
+app = create_app()
+
+WORDS = ('sturdy compact wireless ergonomic premium classic organic stainless adjustable portable '
+         'lightweight durable handmade vintage modern waterproof rechargeable foldable').split()
+
+
+def seed(rows):
+    """Create a vendor with rows products and a customer with rows orders and rows cart lines; return their tokens."""
+    rng = random.Random(0)
+    with app.app_context():
+        vendor = User(username='vendor', password='x', user_type='vendor', vendor_name='Acme Home & Garden',
+                      vendor_revenue_cents=0)
+        customer = User(username='customer', password='x', user_type='customer')
+        db.session.add_all([vendor, customer])
+        db.session.commit()
+        db.session.execute(insert(Product), [
+            {'name': ' '.join(rng.sample(WORDS, 3)).title(), 'price_cents': rng.randint(100, 50000),
+             'description': ' '.join(rng.choices(WORDS, k=25)), 'vendor_id': vendor.id,
+             'vendor_name': vendor.vendor_name}
+            for _ in range(rows)])
+        db.session.commit()
+        product_ids = [product_id for product_id, in db.session.query(Product.id)]
+        return access_token_for(vendor), access_token_for(customer), product_ids
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200, help='products, orders and cart lines (max 200)')
+    parser.add_argument('--repeat', type=int, default=50, help='runs per timing')
+    args = parser.parse_args()
+
+    client = app.test_client()
+    vendor_token, customer_token, product_ids = seed(args.rows)
+    customer = {'Authorization': 'Bearer ' + customer_token}
+    vendor = {'Authorization': 'Bearer ' + vendor_token}
+    cart = {'items': [{'productId': product_id, 'quantity': 2} for product_id in product_ids]}
+    # Order the whole catalog once, then fill the cart again
+    assert client.put('/api/shopping_cart', json=cart, headers=customer).status_code == 200
+    assert client.post('/place-order', headers=customer).status_code == 200
+    assert client.put('/api/shopping_cart', json=cart, headers=customer).status_code == 200
+
+    endpoints = [
+        ('/products', {'limit': args.rows}, {}),
+        ('/api/shopping_cart', {}, customer),
+        ('/get_orders', {}, customer),
+        ('/get_vendor_sales', {'limit': args.rows}, vendor),
+    ]
+    encodings = supported_encodings()
+    print(f"{'endpoint':<20} {'format':<8} {'identity':>9} " + ' '.join(f'{encoding:>8}' for encoding in encodings)
+          + f" {'json ms':>8} " + ' '.join(f'{encoding + " ms":>8}' for encoding in encodings))
+    for path, query, headers in endpoints:
+        for list_format in ('rows', 'columns'):
+            query_string = dict(query, format=list_format)
+            sizes = []
+            for encoding in ['identity'] + encodings:
+                response = client.get(path, query_string=query_string,
+                                      headers=dict(headers, **{'Accept-Encoding': encoding}))
+                assert response.status_code == 200, response.status_code
+                assert response.headers.get('Content-Encoding', 'identity') == encoding
+                sizes.append(len(response.data))
+
+            # The payload as the route hands it to jsonify
+            payload = client.get(path, query_string=query_string, headers=headers).json
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                body = app.json.dumps(payload).encode('utf-8')
+            serialize_ms = (time.perf_counter() - start) / args.repeat * 1000
+            compress_ms = []
+            for encoding in encodings:
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    compress(body, encoding, config.GZIP_LEVEL, config.BROTLI_QUALITY)
+                compress_ms.append((time.perf_counter() - start) / args.repeat * 1000)
+
+            print(f'{path:<20} {list_format:<8} {sizes[0]:>9} ' + ' '.join(f'{size:>8}' for size in sizes[1:])
+                  + f' {serialize_ms:>8.3f} ' + ' '.join(f'{ms:>8.3f}' for ms in compress_ms))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Statement-count harness for the cart, order and checkout endpoints.
+
+Seeds a throwaway SQLite database at two different sizes, calls each endpoint
+and counts the SQL statements it emits. The counts must not depend on the
+number of rows involved; a difference means an N+1 query has crept back in.
+
+Usage: python benchmarks/query_counts.py
+"""
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+
+# Point the app at a temporary database before it is imported
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'query_counts.sqlite3')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from app import build_app, db, access_token_for, User, Product, Sale, ShoppingCartItem
+
+app = build_app()
+
+# Number of vendors stays fixed; the number of rows per request varies
+VENDOR_COUNT = 3
+SIZES = (5, 50)
+
+
+@contextmanager
+def count_queries():
+    """Count the statements sent to the database inside the block."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def seed(rows):
+    """Create a fresh schema with one customer whose cart and orders hold `rows` lines."""
+    db.drop_all()
+    db.create_all()
+    vendors = [User(username=f'vendor{i}', password='x', user_type='vendor',
+                    vendor_name=f'Vendor {i}', vendor_revenue_cents=0) for i in range(VENDOR_COUNT)]
+    customer = User(username='customer', password='x', user_type='normal')
+    db.session.add_all(vendors + [customer])
+    db.session.flush()
+    for i in range(rows):
+        vendor = vendors[i % VENDOR_COUNT]
+        product = Product(name=f'product{i}', price_cents=150, vendor_id=vendor.id,
+                          vendor_name=vendor.vendor_name)
+        db.session.add(product)
+        db.session.flush()
+        db.session.add(ShoppingCartItem(user_id=customer.id, product_id=product.id, quantity=2))
+        db.session.add(Sale(vendor_id=vendor.id, customer_id=customer.id, customer_name=customer.username,
+                            product_name=product.name, quantity=1, total_price_cents=150))
+    db.session.commit()
+    return customer.id
+
+
+def measure(rows):
+    """Return {endpoint: statement count} for a database seeded with `rows` lines."""
+    client = app.test_client()
+    with app.app_context():
+        customer_id = seed(rows)
+        headers = {'Authorization': 'Bearer ' + access_token_for(User.query.get(customer_id))}
+        # Drop the seeding session so every request starts with an empty identity map
+        db.session.remove()
+
+        counts = {}
+        for method, path in (('get', '/api/shopping_cart'),
+                             ('get', '/get_orders'),
+                             ('post', '/place-order')):
+            with count_queries() as statements:
+                response = getattr(client, method)(path, headers=headers)
+            assert response.status_code == 200, (path, response.status_code)
+            counts[path] = len(statements)
+        return counts
+
+
+def main():
+    results = {rows: measure(rows) for rows in SIZES}
+    failed = False
+    for path in results[SIZES[0]]:
+        counts = [results[rows][path] for rows in SIZES]
+        ok = len(set(counts)) == 1
+        failed |= not ok
+        print(f"{path:<20} " + '  '.join(f'{rows} rows: {n}' for rows, n in zip(SIZES, counts))
+              + ('' if ok else '  <-- grows with row count'))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
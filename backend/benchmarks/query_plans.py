@@ -0,0 +1,106 @@
+"""
+EXPLAIN-based check that the hot endpoints are served from indexes.
+
+Calls each endpoint against a seeded throwaway SQLite database, captures
+every SELECT, UPDATE and DELETE it runs, and asks SQLite for the query plan.
+Any full table scan fails the check. The only exception is a scan in
+primary key order that is cut short by LIMIT (the first catalog page).
+
+Usage: python benchmarks/query_plans.py
+"""
+import os
+import re
+import sys
+import tempfile
+
+# Point the app at a temporary database before it is imported
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'query_plans.sqlite3')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from app import db, access_token_for, create_app, User, Product, Sale, ShoppingCartItem
+
+app = create_app()
+
+FULL_SCAN = re.compile(r'\bSCAN (\w+)$')
+
+
+def seed():
+    vendor = User(username='vendor', password='x', user_type='vendor', vendor_name='Vendor', vendor_revenue_cents=0)
+    customer = User(username='customer', password='x', user_type='normal')
+    db.session.add_all([vendor, customer])
+    db.session.flush()
+    db.session.add_all(Product(name=f'product{i}', price_cents=i % 20 * 100, vendor_id=vendor.id,
+                               vendor_name=vendor.vendor_name) for i in range(200))
+    db.session.flush()
+    db.session.add_all(ShoppingCartItem(user_id=customer.id, product_id=i + 1, quantity=1) for i in range(5))
+    db.session.add_all(Sale(vendor_id=vendor.id, customer_id=customer.id, customer_name=customer.username,
+                            product_name=f'product{i}', quantity=1, total_price_cents=100) for i in range(20))
+    db.session.commit()
+    return vendor.id, customer.id
+
+
+def main():
+    with app.app_context():
+        vendor_id, customer_id = seed()
+        headers = {'Authorization': 'Bearer ' + access_token_for(User.query.get(customer_id))}
+        vendor_headers = {'Authorization': 'Bearer ' + access_token_for(User.query.get(vendor_id))}
+        db.session.remove()
+
+        requests = [
+            ('get', '/products', None),
+            ('get', '/products?after_id=50', None),
+            ('get', '/products?sort=price&after_id=50', None),
+            ('get', '/products?sort=name&after_id=50&after_value=product50', None),
+            ('get', '/products?sort=-price&min_price=5&max_price=10', None),
+            ('get', '/products?sort=name', None),
+            ('get', f'/get_products?vendor_id={vendor_id}&after_id=10', None),
+            ('get', f'/get_products?vendor_id={vendor_id}&sort=price', None),
+            ('get', '/get_product/7', None),
+            ('get', '/search-products?q=product1', None),
+            ('get', f'/search-products?q=product&vendor_id={vendor_id}&offset=50', None),
+            ('get', '/api/shopping_cart', headers),
+            ('get', '/get_orders', headers),
+            ('get', '/get_vendor_sales?after_id=15', vendor_headers),
+            ('get', '/get_vendor_sales?status=Processing', vendor_headers),
+            ('get', '/get_vendor_sales?start_date=2000-01-01', vendor_headers),
+            ('get', '/get-vendor-stats', vendor_headers),
+            ('post', '/api/remove-from-cart', headers),
+            ('post', '/place-order', headers),
+        ]
+
+        captured = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().split(None, 1)[0].upper() in ('SELECT', 'UPDATE', 'DELETE'):
+                captured.append((statement, parameters[0] if executemany else parameters))
+
+        client = app.test_client()
+        failures = 0
+        for method, path, request_headers in requests:
+            captured.clear()
+            event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+            try:
+                kwargs = {'headers': request_headers}
+                if path == '/api/remove-from-cart':
+                    kwargs['json'] = {'cartItemId': 1}
+                getattr(client, method)(path, **kwargs)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+            with db.engine.connect() as connection:
+                for statement, parameters in captured:
+                    plan = [row[-1] for row in connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)]
+                    scans = [step for step in plan if FULL_SCAN.search(step)]
+                    # Reading the catalog in primary key order stops after LIMIT rows
+                    if scans and 'ORDER BY product.id' in statement and 'LIMIT' in statement:
+                        scans = []
+                    status = 'FULL SCAN' if scans else 'ok'
+                    failures += bool(scans)
+                    print(f"{status:<9} {method.upper()} {path}: {' | '.join(plan)}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
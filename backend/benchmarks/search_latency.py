@@ -0,0 +1,95 @@
+"""
+Latency of /search-products against a LIKE scan of the catalog.
+
+Builds catalogs of increasing size in a throwaway SQLite database (the FTS5
+index is filled by the insert triggers), then times a set of searches through
+the endpoint and the equivalent LIKE query on the product table. Reports
+p50/p99 milliseconds per catalog size.
+
+Usage: python benchmarks/search_latency.py [--sizes 10000,100000,300000] [--repeat 20]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Point the app at a temporary database before it is imported
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'search_latency.sqlite3')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, or_
+
+from app import db, create_app, User, Product
+
+app = create_app()
+
+# A few thousand made-up words, so that a word matches a realistic share of the catalog
+SYLLABLES = 'ka lo mi ne ru sa te vo bi da fe gu ha ji ko lu ma ni po qu ri so tu va we xi yo za'.split()
+WORDS = [a + b + c for a in SYLLABLES for b in SYLLABLES for c in ('', 'n', 'r', 'x')]
+QUERIES = (WORDS[10], WORDS[100] + ' ' + WORDS[200], WORDS[300][:3], 'acme', WORDS[400] + ' acme')
+
+
+def grow_catalog(vendor_id, start, stop):
+    rng = random.Random(start)
+    rows = [{'name': ' '.join(rng.sample(WORDS, 3)), 'price_cents': rng.randint(1, 500) * 100,
+             'description': ' '.join(rng.choices(WORDS, k=20)), 'vendor_id': vendor_id,
+             'vendor_name': 'Acme' if i % 100 == 0 else f'Vendor {i % 50}'}
+            for i in range(start, stop)]
+    rows[0]['name'] += ' ' + ' '.join(QUERIES)
+    db.session.execute(insert(Product), rows)
+    db.session.commit()
+
+
+def like_search(terms):
+    query = Product.query.order_by(Product.id)
+    for term in terms:
+        query = query.filter(or_(Product.name.icontains(term), Product.description.icontains(term),
+                                 Product.vendor_name.icontains(term)))
+    return query.limit(51).all()
+
+
+def percentiles(timings):
+    timings.sort()
+    return timings[len(timings) // 2] * 1000, timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='10000,100000,300000', help='comma separated catalog sizes')
+    parser.add_argument('--repeat', type=int, default=20, help='runs of each query per size')
+    args = parser.parse_args()
+
+    client = app.test_client()
+    print(f"{'products':>9}  {'search p50':>10} {'search p99':>10}  {'LIKE p50':>9} {'LIKE p99':>9}")
+    with app.app_context():
+        vendor = User(username='vendor', password='x', user_type='vendor', vendor_name='Vendor', vendor_revenue_cents=0)
+        db.session.add(vendor)
+        db.session.commit()
+        vendor_id = vendor.id
+        size = 0
+        for target in (int(value) for value in args.sizes.split(',')):
+            for start in range(size, target, 10000):
+                grow_catalog(vendor_id, start, min(start + 10000, target))
+            size = target
+
+            search_timings, like_timings = [], []
+            for _ in range(args.repeat):
+                for query in QUERIES:
+                    start = time.perf_counter()
+                    response = client.get('/search-products', query_string={'q': query})
+                    search_timings.append(time.perf_counter() - start)
+                    assert response.status_code == 200, response.json
+
+                    start = time.perf_counter()
+                    like_search(query.split())
+                    like_timings.append(time.perf_counter() - start)
+                    db.session.remove()
+            search_p50, search_p99 = percentiles(search_timings)
+            like_p50, like_p99 = percentiles(like_timings)
+            print(f'{size:>9}  {search_p50:>10.2f} {search_p99:>10.2f}  {like_p50:>9.2f} {like_p99:>9.2f}')
+
+
+if __name__ == '__main__':
+    main()
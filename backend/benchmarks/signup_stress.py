@@ -0,0 +1,102 @@
+"""
+Concurrent signup stress benchmark.
+
+Many threads sign up at once, and every username is attempted by several
+threads. Each name must end up with exactly one 201 and one row in the user
+table, every other attempt must get 409, and no request may fail with a
+server error. Also reports signups per second and the statements one signup
+runs.
+
+Passwords are hashed with a single PBKDF2 round here so that the numbers
+show the cost of the database write rather than of the hash.
+
+Usage: python benchmarks/signup_stress.py [--threads 16] [--names 200] [--attempts 4]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+# Point the app at a temporary database before it is imported
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'signup_stress.sqlite3')
+os.environ['PASSWORD_HASH_METHOD'] = 'pbkdf2'
+os.environ['PASSWORD_PBKDF2_ITERATIONS'] = '1'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, func
+
+from app import db, create_app, User
+
+app = create_app()
+
+
+def count_statements(client):
+    """Return the statements run by one successful vendor signup."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement.split(None, 1)[0].upper())
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            response = client.post('/signup', json={'username': 'counted', 'password': 'x',
+                                                    'userType': 'vendor', 'vendorName': 'Counted'})
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    assert response.status_code == 201, response.json
+    return statements
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--names', type=int, default=200, help='distinct usernames')
+    parser.add_argument('--attempts', type=int, default=4, help='signups attempted per username')
+    args = parser.parse_args()
+
+    client = app.test_client()
+    print('statements per signup: ' + ', '.join(count_statements(client)))
+
+    # Interleave the attempts so that signups for the same name run at the same time
+    attempts = [f'user{i}' for _ in range(args.attempts) for i in range(args.names)]
+    results = {}
+    lock = threading.Lock()
+
+    def worker(offset):
+        thread_client = app.test_client()
+        for username in attempts[offset::args.threads]:
+            response = thread_client.post('/signup', json={'username': username, 'password': 'x',
+                                                           'userType': 'vendor', 'vendorName': username.title()})
+            with lock:
+                results.setdefault(username, Counter())[response.status_code] += 1
+
+    threads = [threading.Thread(target=worker, args=(offset,)) for offset in range(args.threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    print(f'{len(attempts)} signups by {args.threads} threads in {elapsed:.2f}s ({len(attempts) / elapsed:.1f}/s)')
+
+    with app.app_context():
+        rows = dict(db.session.query(User.username, func.count()).group_by(User.username).all())
+        vendor_names = dict(db.session.query(User.username, User.vendor_name).all())
+
+    failures = 0
+    for username, statuses in sorted(results.items()):
+        ok = (statuses[201] == 1 and statuses[409] == args.attempts - 1 and rows.get(username) == 1
+              and vendor_names.get(username) == username.title())
+        if not ok:
+            failures += 1
+            print(f'{username}: responses {dict(statuses)}, rows {rows.get(username, 0)}  <-- MISMATCH')
+    print(f'{args.names - failures}/{args.names} usernames created exactly once')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
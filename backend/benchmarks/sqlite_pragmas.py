@@ -0,0 +1,110 @@
+"""
+Mixed read/write throughput on SQLite with default settings vs. the tuned pragmas.
+
+For each configuration a fresh database file is created from the app's
+models. Reader threads page through the product catalog while writer threads
+add cart items and commit, the same mix as /products alongside /add-to-cart.
+Reports reads/s, writes/s and lock errors for both.
+
+Usage: python benchmarks/sqlite_pragmas.py [--readers 8] [--writers 2] [--duration 10]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# Keep the app's own engine away from users.sqlite3; the benchmark builds its own engines
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'unused.sqlite3')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.dialects.sqlite import insert as upsert
+from sqlalchemy.exc import OperationalError
+
+import config
+from app import db, User, Product, ShoppingCartItem
+from database import install_sqlite_pragmas
+
+
+def make_engine(tuned):
+    url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'pragmas.sqlite3')
+    engine = create_engine(url, pool_size=32, max_overflow=0)
+    if tuned:
+        install_sqlite_pragmas(engine)
+    db.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(User), [{'username': 'vendor', 'password': 'x', 'user_type': 'vendor'},
+                                          {'username': 'customer', 'password': 'x', 'user_type': 'normal'}])
+        connection.execute(insert(Product), [{'name': f'product{i}', 'price_cents': i % 50 * 100, 'vendor_id': 1}
+                                             for i in range(5000)])
+    return engine
+
+
+def run(engine, readers, writers, duration):
+    counts = {'reads': 0, 'writes': 0, 'errors': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def reader():
+        done = errors = 0
+        after_id = 0
+        while time.perf_counter() < deadline:
+            try:
+                with engine.connect() as connection:
+                    rows = connection.execute(select(Product).where(Product.id > after_id)
+                                              .order_by(Product.id).limit(50)).all()
+                after_id = rows[-1].id if rows else 0
+                done += 1
+            except OperationalError:
+                errors += 1
+        with lock:
+            counts['reads'] += done
+            counts['errors'] += errors
+
+    def writer():
+        done = errors = 0
+        while time.perf_counter() < deadline:
+            try:
+                with engine.begin() as connection:
+                    # Same upsert as /add-to-cart
+                    statement = upsert(ShoppingCartItem).values(user_id=2, product_id=1 + done % 5000, quantity=1)
+                    connection.execute(statement.on_conflict_do_update(
+                        index_elements=['user_id', 'product_id'],
+                        set_={'quantity': ShoppingCartItem.quantity + statement.excluded.quantity}))
+                done += 1
+            except OperationalError:
+                errors += 1
+        with lock:
+            counts['writes'] += done
+            counts['errors'] += errors
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)] + \
+              [threading.Thread(target=writer) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=10)
+    args = parser.parse_args()
+
+    print('tuned pragmas: ' + ', '.join(f'{name}={value}' for name, value in config.SQLITE_PRAGMAS.items()))
+    print(f"{'configuration':<15} {'reads/s':>10} {'writes/s':>10} {'errors':>7}")
+    for label, tuned in (('default', False), ('tuned', True)):
+        engine = make_engine(tuned)
+        counts = run(engine, args.readers, args.writers, args.duration)
+        engine.dispose()
+        print(f"{label:<15} {counts['reads'] / args.duration:>10.1f} "
+              f"{counts['writes'] / args.duration:>10.1f} {counts['errors']:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Start-up time of a server process, with and without the API docs.
+
+Each run is a fresh Python process that imports the app, creates it with
+create_app() as wsgi.py does, and serves its first request (GET /products)
+and, when the docs are on, the first request for the OpenAPI spec. Three
+setups are compared: the spec built from the route docstrings on its first
+request, the spec exported with ``flask --app app export-api-spec`` and
+served from API_SPEC_FILE, and the docs turned off with API_DOCS_ENABLED=0.
+Reports the median time of each step.
+
+Usage: python benchmarks/startup_time.py [--runs 10]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STEPS = ('import', 'create_app', 'first request', 'spec request')
+
+
+def measure():
+    """Time the steps of starting the app in this process; print them as JSON."""
+    start = time.perf_counter()
+    sys.path.insert(0, BACKEND_DIR)
+    import app
+    imported = time.perf_counter()
+    server = app.create_app()
+    created = time.perf_counter()
+    client = server.test_client()
+    assert client.get('/products').status_code == 200
+    first_request = time.perf_counter()
+    timings = {'import': imported - start, 'create_app': created - imported, 'first request': first_request - created}
+    if os.environ.get('API_DOCS_ENABLED') != '0':
+        assert client.get('/apispec_1.json').status_code == 200
+        timings['spec request'] = time.perf_counter() - first_request
+    print(json.dumps(timings))
+
+
+def run(env):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--measure'], cwd=BACKEND_DIR, env=env,
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=10, help='processes started per setup')
+    parser.add_argument('--measure', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        measure()
+        return
+
+    directory = tempfile.mkdtemp()
+    spec_file = os.path.join(directory, 'openapi.json')
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + os.path.join(directory, 'startup_time.sqlite3'),
+               MAINTENANCE_ENABLED='0')
+    # Creates the schema as well, so that no run below has migrations to apply
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'export-api-spec', spec_file],
+                   cwd=BACKEND_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+
+    setups = [
+        ('docs, spec built', dict(env, API_DOCS_ENABLED='1')),
+        ('docs, spec file', dict(env, API_DOCS_ENABLED='1', API_SPEC_FILE=spec_file)),
+        ('no docs', dict(env, API_DOCS_ENABLED='0')),
+    ]
+    print(f"{'setup':<18} " + ' '.join(f'{step + " ms":>16}' for step in STEPS) + f" {'total ms':>10}")
+    for name, setup_env in setups:
+        # Warm up the bytecode and file system caches
+        run(setup_env)
+        runs = [run(setup_env) for _ in range(args.runs)]
+        medians = {step: statistics.median(timings[step] for timings in runs) * 1000
+                   for step in STEPS if step in runs[0]}
+        print(f'{name:<18} ' + ' '.join(f'{medians[step]:>16.1f}' if step in medians else f'{"-":>16}'
+                                        for step in STEPS) + f' {sum(medians.values()):>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+Read-through cache for product lookups and catalog listings.
+
+Products change rarely compared to how often they are read, so the product
+detail and listing endpoints cache their serialized output here. The only
+writers (create, update and delete product) invalidate it:
+
+* product detail entries are keyed by product id and deleted directly;
+* listing entries embed a generation number in their key. Writes bump the
+  catalog generation (and the vendor's own generation), so stale pages are
+  never looked up again and simply age out of the LRU. The generations are
+  plain counters kept beside the backend, so the backend's stats only count
+  product and listing lookups.
+
+Both kinds of key can also carry the version the database holds for the
+product or the catalog. A write made by another server process cannot
+invalidate this process's cache, but it does change the version, so a
+versioned lookup never returns an entry older than the database.
+
+The storage backend is pluggable. Anything with ``get(key)`` (returning
+``MISSING`` on a miss), ``set(key, value, ttl)``, ``delete(key)`` and
+``stats()`` can be passed in, e.g. a client for a shared cache server or a
+fake in tests.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+# Sentinel so that cached falsy values are still treated as hits
+MISSING = object()
+
+
+class LRUCache:
+    """
+    Thread-safe in-process cache with a per-entry TTL and LRU eviction.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return MISSING
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=MISSING):
+        ttl = self.ttl if ttl is MISSING else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl
+            }
+
+
+class ProductCache:
+    """
+    Product-specific key layout and invalidation on top of a cache backend.
+    """
+
+    def __init__(self, backend=None, ttl=60, maxsize=1024):
+        self.backend = backend if backend is not None else LRUCache(maxsize=maxsize, ttl=ttl)
+        self.ttl = ttl
+        # {'gen:catalog' or 'gen:vendor:<id>': generation}, never evicted
+        self._generations = {}
+        self._generations_lock = threading.Lock()
+
+    def _generation(self, key):
+        with self._generations_lock:
+            return self._generations.get(key, 0)
+
+    def _bump(self, key):
+        with self._generations_lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+    def listing_key(self, args, version=None):
+        """Build the cache key of a listing from its query string arguments and the catalog version."""
+        vendor_id = args.get('vendor_id', type=int)
+        if vendor_id is not None:
+            scope = f'vendor:{vendor_id}:{self._generation(f"gen:vendor:{vendor_id}")}'
+        else:
+            scope = f'all:{self._generation("gen:catalog")}'
+        params = '&'.join(f'{name}={value}' for name, value in sorted(args.items(multi=True)))
+        if version is not None:
+            scope = f'{scope}:v{version}'
+        return f'products:{scope}:{params}'
+
+    def get_or_load(self, key, loader):
+        """Return the cached value for key, calling loader() and caching it on a miss."""
+        value = self.backend.get(key)
+        if value is MISSING:
+            value = loader()
+            self.backend.set(key, value, self.ttl)
+        return value
+
+    def get_product(self, product_id, version=None):
+        return self.backend.get(product_key(product_id, version))
+
+    def set_product(self, product_id, product_data, version=None):
+        self.backend.set(product_key(product_id, version), product_data, self.ttl)
+
+    def invalidate_product(self, product_id, vendor_id):
+        """Drop a product's detail entry and every listing that could contain it."""
+        if product_id is not None:
+            # Versioned entries are never looked up again and age out
+            self.backend.delete(product_key(product_id, None))
+        self._bump('gen:catalog')
+        self._bump(f'gen:vendor:{vendor_id}')
+
+    def stats(self):
+        return self.backend.stats()
+
+
+def product_key(product_id, version):
+    return f'product:{product_id}' if version is None else f'product:{product_id}:v{version}'
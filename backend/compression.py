@@ -0,0 +1,103 @@
+"""
+Negotiated compression of response bodies.
+
+install_response_compression() adds an after_request hook that compresses
+text and JSON responses with the best encoding the client accepts:
+
+* ``br`` (brotli), when the optional ``brotli`` package is installed;
+* ``gzip``, from the standard library, otherwise.
+
+Small responses are left alone, since below roughly a kilobyte the encoding
+overhead and CPU time outweigh the bytes saved. Streamed responses, whose
+size is not known up front, are gzipped chunk by chunk as they are produced,
+so the body is still never held in memory as a whole. Compressed
+responses get ``Vary: Accept-Encoding`` so that shared caches keep the
+encodings apart, and a strong ETag is weakened because the compressed bytes
+are no longer the ones it was computed for.
+
+Hooks registered later run earlier, so installing this after the request
+metrics makes the metrics record the size that is actually sent.
+"""
+import gzip
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Content types worth compressing; images and archives are already compressed
+COMPRESSIBLE_MIMETYPES = {
+    'application/json', 'application/javascript', 'application/xml',
+    'text/html', 'text/css', 'text/csv', 'text/plain', 'text/javascript'
+}
+
+
+def supported_encodings():
+    """Return the encodings this server can produce, most preferred first."""
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def compress(data, encoding, gzip_level=6, brotli_quality=4):
+    """Return data compressed with encoding ('br' or 'gzip')."""
+    if encoding == 'br':
+        return brotli.compress(data, quality=brotli_quality)
+    # mtime=0 keeps the output the same for the same body
+    return gzip.compress(data, compresslevel=gzip_level, mtime=0)
+
+
+def gzip_stream(chunks, gzip_level=6):
+    """Gzip a streamed body chunk by chunk."""
+    # wbits=31 writes the gzip header and trailer around the deflate stream
+    compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+    try:
+        for chunk in chunks:
+            data = compressor.compress(chunk.encode() if isinstance(chunk, str) else chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def install_response_compression(app, min_size=1024, gzip_level=6, brotli_quality=4):
+    """Compress the app's responses of at least min_size bytes for clients that accept it."""
+    encodings = supported_encodings()
+
+    @app.after_request
+    def compress_response(response):
+        if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+            return response
+        # The body depends on Accept-Encoding even when it goes out uncompressed
+        response.vary.add('Accept-Encoding')
+        if (response.direct_passthrough
+                or response.status_code < 200 or response.status_code in (204, 304)
+                or 'Content-Encoding' in response.headers):
+            return response
+
+        if response.is_streamed and response.content_length is None:
+            # Gzipped on the fly as the body is generated, whatever its final size
+            if request.accept_encodings.best_match(['gzip']) is None:
+                return response
+            response.response = gzip_stream(response.response, gzip_level)
+            response.headers.pop('Content-Length', None)
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            if (response.content_length or 0) < min_size:
+                return response
+            encoding = request.accept_encodings.best_match(encodings)
+            if encoding is None:
+                return response
+            data = response.get_data()
+            compressed = compress(data, encoding, gzip_level, brotli_quality)
+            if len(compressed) >= len(data):
+                return response
+            response.set_data(compressed)
+            response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag is not None and not weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,113 @@
+"""
+Deployment settings, read from environment variables.
+
+The defaults match local development (`python app.py`). In production the
+same values size the gunicorn worker pool (see gunicorn.conf.py) and the
+SQLAlchemy connection pool, so that every server thread can hold a database
+connection without waiting on the pool.
+"""
+import os
+import tempfile
+
+# Database to connect to. Any SQLAlchemy URL works; the SQLite pragmas below
+# are only applied to SQLite databases.
+DATABASE_URL = os.environ.get('DATABASE_URL', 'sqlite:///users.sqlite3')
+
+# Address the production server listens on
+BIND = os.environ.get('BIND', '127.0.0.1:5000')
+
+# Origins allowed to call the API from a browser, comma separated
+CORS_ORIGINS = os.environ.get('CORS_ORIGINS', 'http://localhost:3000').split(',')
+
+# Number of server processes. SQLite allows a single writer at a time, so more
+# processes mostly help read-heavy traffic; the usual 2 * CPUs + 1 applies to
+# a server database.
+WORKERS = int(os.environ.get('WEB_CONCURRENCY', (os.cpu_count() or 1) * 2 + 1))
+
+# Request threads per server process
+THREADS = int(os.environ.get('WEB_THREADS', 4))
+
+# Connection pool, sized by default to one connection per request thread plus
+# headroom for streamed responses that hold a connection while the next request starts
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', THREADS))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', THREADS))
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+# Seconds after which a connection is replaced; -1 keeps connections forever.
+# Server databases that drop idle connections need this below their idle timeout.
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', -1))
+# Connections per process for the async read API (see async_api.py). One event
+# loop has many requests waiting on the database at once, not one per thread.
+ASYNC_DB_POOL_SIZE = int(os.environ.get('ASYNC_DB_POOL_SIZE', 20))
+
+# Requests taking at least this many seconds are logged with their slowest SQL
+# statements (see metrics.py)
+SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_SECONDS', 0.5))
+
+# Password hashing policy (see passwords.py). PASSWORD_HASH_METHOD is scrypt or
+# pbkdf2; raise the work factor as far as the login latency budget allows.
+# Stored hashes are upgraded to these settings when their owner next logs in.
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+PASSWORD_SCRYPT_N = int(os.environ.get('PASSWORD_SCRYPT_N', 2 ** 14))
+PASSWORD_SCRYPT_R = int(os.environ.get('PASSWORD_SCRYPT_R', 8))
+PASSWORD_SCRYPT_P = int(os.environ.get('PASSWORD_SCRYPT_P', 1))
+PASSWORD_PBKDF2_ITERATIONS = int(os.environ.get('PASSWORD_PBKDF2_ITERATIONS', 600000))
+# Threads per process that run password hashes; 0 hashes on the request thread
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 0))
+
+# Background maintenance (see scheduler.py); set MAINTENANCE_ENABLED=0 to turn it off.
+# Intervals are in seconds.
+MAINTENANCE_ENABLED = os.environ.get('MAINTENANCE_ENABLED', '1') not in ('0', 'false', 'no')
+# Cart lines older than this many days are deleted as abandoned
+CART_EXPIRY_DAYS = float(os.environ.get('CART_EXPIRY_DAYS', 30))
+CART_EXPIRY_INTERVAL = int(os.environ.get('CART_EXPIRY_INTERVAL', 3600))
+# Refresh the query planner statistics (PRAGMA optimize / ANALYZE)
+DB_OPTIMIZE_INTERVAL = int(os.environ.get('DB_OPTIMIZE_INTERVAL', 3600))
+# Only the server process holding this lock file runs the jobs
+MAINTENANCE_LOCK_FILE = os.environ.get('MAINTENANCE_LOCK_FILE',
+                                       os.path.join(tempfile.gettempdir(), 'backend-maintenance.lock'))
+# Copy the SQLite write-ahead log into the database (a PASSIVE checkpoint)
+WAL_CHECKPOINT_INTERVAL = int(os.environ.get('WAL_CHECKPOINT_INTERVAL', 300))
+
+# Response compression (see compression.py). Responses smaller than
+# COMPRESSION_MIN_SIZE bytes are sent as they are; brotli is only offered
+# when the brotli package is installed.
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', 4))
+
+# Swagger UI at /apidocs/ and the OpenAPI spec at /apispec_1.json (see docs.py).
+# API_SPEC_FILE serves a spec exported with `flask --app app export-api-spec`
+# instead of building it from the route docstrings.
+API_DOCS_ENABLED = os.environ.get('API_DOCS_ENABLED', '1') not in ('0', 'false', 'no')
+API_SPEC_FILE = os.environ.get('API_SPEC_FILE') or None
+
+# Pragmas run on every new SQLite connection (see database.py).
+# WAL lets readers proceed while a write transaction commits, and NORMAL
+# synchronous is durable in WAL mode except for the last commits on power loss.
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    # Milliseconds to wait for the write lock before failing with "database is locked"
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 30000)),
+    # Bytes of the database file to memory-map for reads
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    # Page cache per connection; negative values are in KiB
+    'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -64000)),
+    'temp_store': 'MEMORY'
+}
+
+
+def engine_options():
+    """
+    Return SQLALCHEMY_ENGINE_OPTIONS for DATABASE_URL.
+    """
+    if DATABASE_URL in ('sqlite://', 'sqlite:///:memory:'):
+        # In-memory databases live in a single connection and cannot be pooled
+        return {}
+    return {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': True
+    }
@@ -0,0 +1,27 @@
+"""
+Connection-level database setup shared by the app and the benchmarks.
+"""
+from sqlalchemy import event
+
+import config
+
+
+def install_sqlite_pragmas(engine, pragmas=None):
+    """
+    Run the SQLite pragmas on every connection the engine opens.
+
+    Does nothing for other databases, so the same models can run on a server
+    database by changing DATABASE_URL.
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = config.SQLITE_PRAGMAS if pragmas is None else pragmas
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name} = {value}')
+        finally:
+            cursor.close()
@@ -0,0 +1,54 @@
+"""
+Swagger UI and OpenAPI spec of the API.
+
+flasgger builds the spec by parsing the YAML in the docstring of every route,
+which takes longer than starting the rest of the app. It is only imported
+when the docs are enabled, and the spec is built on its first request rather
+than at start-up. Set API_DOCS_ENABLED=0 to leave the docs out altogether.
+
+In production the spec can instead be written once, at build time:
+
+    flask --app app export-api-spec openapi.json
+
+With API_SPEC_FILE pointing at that file, ``/apispec_1.json`` sends its bytes
+as they are, with an ETag, and the route docstrings are never parsed. The
+file must be exported again whenever a route's docstring changes.
+"""
+import hashlib
+
+from flask import Response, request
+
+# flasgger's default spec, served at /apispec_1.json and shown at /apidocs/
+SPEC_ENDPOINT = 'apispec_1'
+
+
+def install_api_docs(app, spec_file=None):
+    """Serve the Swagger UI at /apidocs/ and the spec, built lazily or read from spec_file."""
+    # Imported here so that an app without docs never loads flasgger and its YAML and JSON Schema libraries
+    from flasgger import Swagger
+
+    swagger = Swagger(app)
+    if spec_file is None:
+        return swagger
+
+    with open(spec_file, 'rb') as f:
+        spec = f.read()
+    etag = hashlib.sha1(spec).hexdigest()
+
+    def send_spec():
+        response = Response(spec, mimetype='application/json')
+        response.set_etag(etag)
+        return response.make_conditional(request)
+
+    # Take over the spec route flasgger registered, so the UI still finds the spec where it expects it
+    app.view_functions[f'flasgger.{SPEC_ENDPOINT}'] = send_spec
+    return swagger
+
+
+def build_api_spec(app):
+    """Return the spec flasgger generates from the route docstrings of app."""
+    from flasgger import Swagger
+
+    swagger = getattr(app, 'swag', None) or Swagger(app)
+    with app.test_request_context():
+        return swagger.get_apispecs(SPEC_ENDPOINT)
@@ -0,0 +1,38 @@
+"""
+Gunicorn settings for serving the API in production.
+
+Worker and thread counts come from config.py (WEB_CONCURRENCY, WEB_THREADS),
+which also sizes the database connection pool to match.
+"""
+import subprocess
+import sys
+
+# Imported by name: a module called "config" would clash with gunicorn's own setting
+from config import BIND, WORKERS, THREADS
+
+bind = BIND
+workers = WORKERS
+threads = THREADS
+# Threaded workers so that requests waiting on the database do not block a whole process
+worker_class = 'gthread'
+
+# Each worker opens its own database connections after the fork
+preload_app = False
+
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers periodically to cap slow memory growth
+max_requests = 10000
+max_requests_jitter = 1000
+
+accesslog = '-'
+errorlog = '-'
+
+
+def on_starting(server):
+    # Upgrade the schema once, before any worker starts. Workers still call
+    # upgrade() on start-up, but then find nothing to do. It runs in a separate
+    # process so that the master neither imports the app nor holds database connections.
+    subprocess.run([sys.executable, 'migrations.py'], cwd=server.cfg.chdir, check=True)
@@ -0,0 +1,223 @@
+"""
+Per-request performance metrics in the Prometheus text format.
+
+install_request_metrics() hooks into a Flask app and a SQLAlchemy engine:
+
+* before_request starts a RequestStats for the request in ``g``;
+* before/after_cursor_execute on the engine count the statements the request
+  runs and time them, and handle_error does the same for statements that fail;
+* after_request records the request, or for a streamed response registers a
+  close callback, so that it is only measured once its last chunk was sent.
+
+Each finished request is added to the latency, statement count, database time
+and response size histograms of its endpoint (the URL rule, so
+/get_product/1 and /get_product/2 share a series). Requests slower than the
+threshold are logged with their slowest statements.
+
+Metrics are kept per process. With several gunicorn workers every worker
+exposes its own numbers; scrape each worker or sum them in Prometheus.
+"""
+import heapq
+import logging
+import threading
+import time
+
+from flask import g, has_app_context, request
+from sqlalchemy import event
+
+slow_request_log = logging.getLogger('slow_requests')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Statements listed in a slow request log entry
+SLOW_STATEMENTS_LOGGED = 5
+
+
+class Histogram:
+    """
+    Cumulative histogram with fixed buckets, one series per label set.
+
+    Not thread-safe on its own; RequestMetrics holds a lock around it.
+    """
+
+    def __init__(self, name, description, buckets):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, labels, value):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * len(self.buckets), 0, 0.0]
+        counts = series[0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+        series[1] += 1
+        series[2] += value
+
+    def render(self, lines):
+        lines.append(f'# HELP {self.name} {self.description}')
+        lines.append(f'# TYPE {self.name} histogram')
+        for labels, (counts, count, total) in sorted(self._series.items()):
+            label_text = format_labels(labels)
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {bucket_count}')
+            lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {total}')
+            lines.append(f'{self.name}_count{{{label_text}}} {count}')
+
+
+def format_labels(labels):
+    """Render ((name, value), ...) as Prometheus label pairs."""
+    return ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                    for name, value in labels)
+
+
+class RequestStats:
+    """What one request did: its statements, their total time and the slowest ones."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.slowest = []
+        self.response_bytes = 0
+
+    def add_statement(self, statement, seconds):
+        self.statements += 1
+        self.sql_seconds += seconds
+        # Keep only the slowest few; the counter breaks ties without comparing statements
+        entry = (seconds, self.statements, statement)
+        if len(self.slowest) < SLOW_STATEMENTS_LOGGED:
+            heapq.heappush(self.slowest, entry)
+        else:
+            heapq.heappushpop(self.slowest, entry)
+
+
+class RequestMetrics:
+    """
+    Thread-safe store of the per-endpoint request histograms.
+    """
+
+    def __init__(self, slow_request_seconds=0.5):
+        self.slow_request_seconds = slow_request_seconds
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.slow_requests = 0
+        self.latency = Histogram('http_request_duration_seconds',
+                                 'Time from the start of a request until its response was sent.', LATENCY_BUCKETS)
+        self.statements = Histogram('http_request_sql_statements',
+                                    'SQL statements executed per request.', STATEMENT_BUCKETS)
+        self.sql_time = Histogram('http_request_sql_duration_seconds',
+                                  'Time spent executing SQL per request.', LATENCY_BUCKETS)
+        self.response_size = Histogram('http_response_size_bytes',
+                                       'Size of the response body.', SIZE_BUCKETS)
+
+    def record(self, method, endpoint, status, stats):
+        """Add a finished request; return its duration in seconds."""
+        duration = time.perf_counter() - stats.start
+        labels = (('method', method), ('endpoint', endpoint))
+        with self._lock:
+            key = labels + (('status', status),)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.latency.observe(labels, duration)
+            self.statements.observe(labels, stats.statements)
+            self.sql_time.observe(labels, stats.sql_seconds)
+            self.response_size.observe(labels, stats.response_bytes)
+            if duration >= self.slow_request_seconds:
+                self.slow_requests += 1
+        return duration
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            lines.append('# HELP http_requests_total Requests handled, by endpoint and status code.')
+            lines.append('# TYPE http_requests_total counter')
+            for labels, count in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{{{format_labels(labels)}}} {count}')
+            lines.append(f'# HELP http_slow_requests_total Requests that took at least '
+                         f'{self.slow_request_seconds} seconds.')
+            lines.append('# TYPE http_slow_requests_total counter')
+            lines.append(f'http_slow_requests_total {self.slow_requests}')
+            for histogram in (self.latency, self.statements, self.sql_time, self.response_size):
+                histogram.render(lines)
+        return '\n'.join(lines) + '\n'
+
+
+def count_bytes(chunks, stats):
+    """Pass a streamed body through while adding up its size."""
+    try:
+        for chunk in chunks:
+            stats.response_bytes += len(chunk.encode() if isinstance(chunk, str) else chunk)
+            yield chunk
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def install_request_metrics(app, engine, metrics):
+    """Record every request the app handles, and the statements it runs on engine, in metrics."""
+
+    @app.before_request
+    def start_request_stats():
+        g.request_stats = RequestStats()
+
+    @app.after_request
+    def finish_request_stats(response):
+        stats = g.get('request_stats')
+        if stats is None:
+            return response
+        method = request.method
+        endpoint = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+        path = request.full_path.rstrip('?')
+
+        def finish():
+            duration = metrics.record(method, endpoint, response.status_code, stats)
+            if duration >= metrics.slow_request_seconds:
+                slowest = sorted(stats.slowest, reverse=True)
+                slow_request_log.warning(
+                    'Slow request %s %s: %.3fs, %d SQL statements in %.3fs%s', method, path, duration,
+                    stats.statements, stats.sql_seconds,
+                    ''.join(f'\n  {seconds * 1000:.1f}ms  {statement}' for seconds, _, statement in slowest))
+
+        if response.is_streamed and response.content_length is None:
+            # The body is still to be generated; measure once the server closes it
+            response.response = count_bytes(response.response, stats)
+            response.call_on_close(finish)
+        else:
+            stats.response_bytes = response.content_length or 0
+            finish()
+        return response
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+        context.statement_start = time.perf_counter()
+
+    def record_statement(statement, context, error=None):
+        # Statements outside a request (migrations, CLI commands) are not recorded
+        if not has_app_context():
+            return
+        stats = g.get('request_stats')
+        start = getattr(context, 'statement_start', None)
+        if stats is None or start is None:
+            return
+        if error is not None:
+            statement = f'{statement}  -- failed: {type(error).__name__}'
+        stats.add_statement(statement, time.perf_counter() - start)
+
+    # Statements run while a streamed body is generated still count towards
+    # its request, since stream_with_context keeps the request context alive
+    @event.listens_for(engine, 'after_cursor_execute')
+    def stop_statement_timer(conn, cursor, statement, parameters, context, executemany):
+        record_statement(statement, context)
+
+    # Failed statements count too, e.g. an INSERT rejected by a unique index
+    @event.listens_for(engine, 'handle_error')
+    def stop_failed_statement_timer(exception_context):
+        record_statement(exception_context.statement, exception_context.execution_context,
+                         exception_context.original_exception)
@@ -0,0 +1,415 @@
+"""
+Schema migrations for existing databases.
+
+db.create_all() creates missing tables but never changes a table that already
+exists, so schema changes are written here as ordered steps. upgrade() runs
+the steps that have not been applied yet and records them in the
+schema_migrations table, so it is safe to call on each start, from any
+number of processes at once. A new database is created straight from the
+models and all steps are marked as applied.
+
+Steps must not depend on the current models: they run against the schema as
+it was when they were written, and later steps may change it again.
+
+To upgrade the database without starting the server:
+
+    python migrations.py
+
+gunicorn.conf.py runs this once before it starts the workers.
+"""
+from decimal import Decimal
+
+from sqlalchemy import (BigInteger, Column, DateTime, ForeignKey, ForeignKeyConstraint, Index, Integer, MetaData,
+                        Numeric, String, Table, cast, func, insert, inspect, select, update)
+from sqlalchemy.schema import AddConstraint, CreateColumn, DropConstraint
+
+metadata = MetaData()
+
+# Key of the PostgreSQL advisory lock held while upgrading
+SCHEMA_LOCK_ID = 4242001
+
+schema_migrations = Table(
+    'schema_migrations', metadata,
+    Column('id', String(100), primary_key=True),
+    Column('applied_at', DateTime, server_default=func.now())
+)
+
+
+def create_index(connection, table_name, index_name, *column_names, unique=False):
+    """Create an index unless a table already has one with that name."""
+    existing = {index['name'] for index in inspect(connection).get_indexes(table_name)}
+    if index_name in existing:
+        return
+    table = Table(table_name, MetaData(), autoload_with=connection)
+    Index(index_name, *(table.c[name] for name in column_names), unique=unique).create(connection)
+
+
+def drop_index(connection, table_name, index_name):
+    """Drop an index if the table has one with that name."""
+    existing = {index['name'] for index in inspect(connection).get_indexes(table_name)}
+    if index_name not in existing:
+        return
+    table = Table(table_name, MetaData(), autoload_with=connection)
+    Index(index_name, _table=table).drop(connection)
+
+
+def add_column(connection, table_name, column):
+    """Add a column, with its foreign key if it has one, unless the table already has it."""
+    existing = {existing_column['name'] for existing_column in inspect(connection).get_columns(table_name)}
+    if column.name in existing:
+        return
+    preparer = connection.dialect.identifier_preparer
+    column_ddl = str(CreateColumn(column).compile(dialect=connection.dialect))
+    # CreateColumn leaves foreign keys to the table's constraints; declare them inline
+    for foreign_key in column.foreign_keys:
+        referred_table, referred_column = foreign_key.target_fullname.split('.')
+        column_ddl += f' REFERENCES {preparer.quote(referred_table)} ({preparer.quote(referred_column)})'
+        if foreign_key.ondelete:
+            column_ddl += f' ON DELETE {foreign_key.ondelete}'
+    connection.exec_driver_sql(f'ALTER TABLE {preparer.quote(table_name)} ADD COLUMN {column_ddl}')
+
+
+def drop_column(connection, table_name, column_name):
+    """Drop a column if the table has it. Needs SQLite 3.35 or later."""
+    existing = {column['name'] for column in inspect(connection).get_columns(table_name)}
+    if column_name not in existing:
+        return
+    preparer = connection.dialect.identifier_preparer
+    connection.exec_driver_sql(
+        f'ALTER TABLE {preparer.quote(table_name)} DROP COLUMN {preparer.quote(column_name)}')
+
+
+def add_lookup_indexes(connection):
+    # Keyset pagination of the product catalog
+    create_index(connection, 'product', 'ix_product_vendor_id_id', 'vendor_id', 'id')
+    create_index(connection, 'product', 'ix_product_price_id', 'price', 'id')
+    create_index(connection, 'product', 'ix_product_vendor_id_price_id', 'vendor_id', 'price', 'id')
+    create_index(connection, 'product', 'ix_product_name_id', 'name', 'id')
+    # Foreign keys and lookup columns used by the order, sales and cart endpoints
+    create_index(connection, 'sale', 'ix_sale_vendor_id', 'vendor_id')
+    create_index(connection, 'sale', 'ix_sale_customer_name', 'customer_name')
+    create_index(connection, 'shopping_cart_item', 'ix_shopping_cart_item_user_id', 'user_id')
+
+
+def add_sale_foreign_keys(connection):
+    add_column(connection, 'sale', Column('customer_id', Integer, ForeignKey('user.id'), nullable=True))
+    add_column(connection, 'sale', Column('product_id', Integer, ForeignKey('product.id'), nullable=True))
+
+    sale = Table('sale', MetaData(), autoload_with=connection)
+    user = Table('user', MetaData(), autoload_with=connection)
+    product = Table('product', MetaData(), autoload_with=connection)
+    # Resolve the name snapshots to ids. Names that no longer match a row stay NULL.
+    connection.execute(
+        sale.update()
+        .where(sale.c.customer_id.is_(None))
+        .values(customer_id=select(user.c.id)
+                .where(user.c.username == sale.c.customer_name)
+                .scalar_subquery())
+    )
+    # Product names are only unique per vendor; take the oldest match
+    connection.execute(
+        sale.update()
+        .where(sale.c.product_id.is_(None))
+        .values(product_id=select(func.min(product.c.id))
+                .where(product.c.vendor_id == sale.c.vendor_id, product.c.name == sale.c.product_name)
+                .scalar_subquery())
+    )
+
+    create_index(connection, 'sale', 'ix_sale_customer_id', 'customer_id')
+    create_index(connection, 'sale', 'ix_sale_product_id', 'product_id')
+    # Orders are looked up by customer_id now
+    drop_index(connection, 'sale', 'ix_sale_customer_name')
+
+
+def add_sale_created_at(connection):
+    # Existing sales have no recorded date and keep NULL
+    add_column(connection, 'sale', Column('created_at', DateTime, nullable=True))
+    create_index(connection, 'sale', 'ix_sale_vendor_id_status_id', 'vendor_id', 'status', 'id')
+    create_index(connection, 'sale', 'ix_sale_vendor_id_created_at', 'vendor_id', 'created_at')
+
+
+def add_vendor_sales_stats(connection):
+    if inspect(connection).has_table('vendor_sales_stat'):
+        return
+    stats_metadata = MetaData()
+    # The foreign key needs the user table in the same metadata
+    Table('user', stats_metadata, autoload_with=connection)
+    stats = Table(
+        'vendor_sales_stat', stats_metadata,
+        Column('vendor_id', Integer, ForeignKey('user.id'), primary_key=True),
+        Column('day', String(10), primary_key=True),
+        Column('product_id', Integer, primary_key=True),
+        Column('status', String(20), primary_key=True),
+        Column('sales_count', Integer, nullable=False, default=0),
+        Column('quantity', Integer, nullable=False, default=0),
+        Column('revenue', Numeric(12, 2), nullable=False, default=0)
+    )
+    stats.create(connection)
+
+    # Fill it from the existing sales in one streaming pass
+    sale = Table('sale', MetaData(), autoload_with=connection)
+    totals = {}
+    rows = connection.execution_options(yield_per=5000).execute(
+        select(sale.c.vendor_id, sale.c.created_at, sale.c.product_id, sale.c.status,
+               sale.c.quantity, sale.c.total_price))
+    for vendor_id, created_at, product_id, status, quantity, total_price in rows:
+        key = (vendor_id, created_at.strftime('%Y-%m-%d') if created_at else 'unknown',
+               product_id or 0, status or 'Processing')
+        entry = totals.setdefault(key, [0, 0, Decimal(0)])
+        entry[0] += 1
+        entry[1] += quantity
+        entry[2] += Decimal(str(total_price))
+    if totals:
+        connection.execute(stats.insert(), [
+            {'vendor_id': vendor_id, 'day': day, 'product_id': product_id, 'status': status,
+             'sales_count': count, 'quantity': quantity, 'revenue': revenue}
+            for (vendor_id, day, product_id, status), (count, quantity, revenue) in totals.items()])
+
+
+def add_product_search(connection):
+    # Full-text search is only indexed on SQLite (FTS5)
+    if connection.dialect.name != 'sqlite':
+        return
+    connection.exec_driver_sql(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5("
+        "name, description, vendor_name, content='product', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2')")
+    connection.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS product_search_insert AFTER INSERT ON product BEGIN "
+        "INSERT INTO product_search(rowid, name, description, vendor_name) "
+        "VALUES (new.id, new.name, new.description, new.vendor_name); END")
+    connection.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS product_search_delete AFTER DELETE ON product BEGIN "
+        "INSERT INTO product_search(product_search, rowid, name, description, vendor_name) "
+        "VALUES ('delete', old.id, old.name, old.description, old.vendor_name); END")
+    connection.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS product_search_update AFTER UPDATE OF name, description, vendor_name "
+        "ON product BEGIN "
+        "INSERT INTO product_search(product_search, rowid, name, description, vendor_name) "
+        "VALUES ('delete', old.id, old.name, old.description, old.vendor_name); "
+        "INSERT INTO product_search(rowid, name, description, vendor_name) "
+        "VALUES (new.id, new.name, new.description, new.vendor_name); END")
+    # Index the existing catalog
+    connection.exec_driver_sql("INSERT INTO product_search(product_search) VALUES ('rebuild')")
+
+
+def merge_cart_duplicates(connection):
+    cart = Table('shopping_cart_item', MetaData(), autoload_with=connection)
+    duplicate = cart.alias('duplicate')
+    first_ids = select(func.min(cart.c.id)).group_by(cart.c.user_id, cart.c.product_id)
+    # The oldest line of each product in a cart takes the total quantity...
+    connection.execute(
+        cart.update()
+        .where(cart.c.id.in_(first_ids.having(func.count() > 1)))
+        .values(quantity=select(func.sum(duplicate.c.quantity))
+                .where(duplicate.c.user_id == cart.c.user_id, duplicate.c.product_id == cart.c.product_id)
+                .scalar_subquery())
+    )
+    # ...and the other lines go
+    connection.execute(cart.delete().where(cart.c.id.not_in(first_ids)))
+
+    create_index(connection, 'shopping_cart_item', 'uq_shopping_cart_item_user_id_product_id',
+                 'user_id', 'product_id', unique=True)
+    # Covered by the unique index, which starts with user_id
+    drop_index(connection, 'shopping_cart_item', 'ix_shopping_cart_item_user_id')
+
+
+def add_cart_created_at_index(connection):
+    # Abandoned cart expiry deletes by age
+    create_index(connection, 'shopping_cart_item', 'ix_shopping_cart_item_created_at', 'created_at')
+
+
+def add_catalog_versions(connection):
+    # Existing products start at version 1, the counter's starting value
+    add_column(connection, 'product', Column('version', Integer, nullable=False, server_default='1'))
+    if inspect(connection).has_table('catalog_version'):
+        return
+    catalog_version = Table(
+        'catalog_version', MetaData(),
+        Column('id', Integer, primary_key=True),
+        Column('version', Integer, nullable=False)
+    )
+    catalog_version.create(connection)
+    connection.execute(catalog_version.insert().values(id=1, version=1))
+
+
+def store_money_in_cents(connection):
+    # The price indexes are rebuilt on the new column; the old column cannot
+    # be dropped while an index uses it
+    drop_index(connection, 'product', 'ix_product_price_id')
+    drop_index(connection, 'product', 'ix_product_vendor_id_price_id')
+    for table_name, old_name, new_name, column_type, nullable in (
+            ('product', 'price', 'price_cents', Integer, False),
+            ('sale', 'total_price', 'total_price_cents', BigInteger, False),
+            ('user', 'vendor_revenue', 'vendor_revenue_cents', BigInteger, True),
+            ('vendor_sales_stat', 'revenue', 'revenue_cents', BigInteger, False)):
+        existing = {column['name'] for column in inspect(connection).get_columns(table_name)}
+        if old_name not in existing:
+            continue
+        add_column(connection, table_name, Column(new_name, column_type, nullable=nullable, server_default='0'))
+        # Round to the nearest cent; NULL revenue stays NULL
+        table = Table(table_name, MetaData(), autoload_with=connection)
+        connection.execute(update(table).values({new_name: cast(func.round(table.c[old_name] * 100), Integer)}))
+        drop_column(connection, table_name, old_name)
+    create_index(connection, 'product', 'ix_product_price_cents_id', 'price_cents', 'id')
+    create_index(connection, 'product', 'ix_product_vendor_id_price_cents_id', 'vendor_id', 'price_cents', 'id')
+
+
+def add_cart_updated_at(connection):
+    # Abandoned carts expire by their last change rather than their first line
+    add_column(connection, 'shopping_cart_item', Column('updated_at', DateTime, nullable=True))
+    cart = Table('shopping_cart_item', MetaData(), autoload_with=connection)
+    connection.execute(update(cart).values(updated_at=func.coalesce(cart.c.created_at, func.now())))
+    create_index(connection, 'shopping_cart_item', 'ix_shopping_cart_item_updated_at', 'updated_at')
+    drop_index(connection, 'shopping_cart_item', 'ix_shopping_cart_item_created_at')
+
+
+def add_sale_foreign_key_constraints(connection):
+    # 0002 added customer_id and product_id without their foreign keys. A
+    # deleted product's sales lose their product_id, as delete_product does now.
+    table_metadata = MetaData()
+    sale = Table('sale', table_metadata, autoload_with=connection)
+    user = Table('user', table_metadata, autoload_with=connection)
+    product = Table('product', table_metadata, autoload_with=connection)
+    wanted = {
+        'customer_id': ForeignKeyConstraint(['customer_id'], ['user.id']),
+        'product_id': ForeignKeyConstraint(['product_id'], ['product.id'], ondelete='SET NULL'),
+    }
+
+    # Ids of rows that no longer exist would violate the constraints
+    for column, referred in (('customer_id', user), ('product_id', product)):
+        connection.execute(update(sale)
+                           .where(sale.c[column].is_not(None), sale.c[column].not_in(select(referred.c.id)))
+                           .values({column: None}))
+    # The sales stats count sales without a product under product 0
+    stats = Table('vendor_sales_stat', table_metadata, autoload_with=connection)
+    orphaned = (stats.c.product_id != 0) & stats.c.product_id.not_in(select(product.c.id))
+    totals = {}
+    for vendor_id, day, status, count, quantity, revenue_cents in connection.execute(
+            select(stats.c.vendor_id, stats.c.day, stats.c.status, stats.c.sales_count, stats.c.quantity,
+                   stats.c.revenue_cents).where(orphaned)):
+        entry = totals.setdefault((vendor_id, day, status), [0, 0, 0])
+        entry[0] += count
+        entry[1] += quantity
+        entry[2] += revenue_cents
+    connection.execute(stats.delete().where(orphaned))
+    for (vendor_id, day, status), (count, quantity, revenue_cents) in totals.items():
+        key = (stats.c.vendor_id == vendor_id, stats.c.day == day, stats.c.product_id == 0, stats.c.status == status)
+        merged = connection.execute(
+            update(stats).where(*key).values(sales_count=stats.c.sales_count + count,
+                                             quantity=stats.c.quantity + quantity,
+                                             revenue_cents=stats.c.revenue_cents + revenue_cents)
+        ).rowcount
+        if not merged:
+            connection.execute(stats.insert().values(vendor_id=vendor_id, day=day, product_id=0, status=status,
+                                                     sales_count=count, quantity=quantity,
+                                                     revenue_cents=revenue_cents))
+
+    existing = {tuple(foreign_key['constrained_columns']): foreign_key
+                for foreign_key in inspect(connection).get_foreign_keys('sale')}
+    missing = [column for column, constraint in wanted.items()
+               if (column,) not in existing
+               or existing[(column,)]['options'].get('ondelete') != constraint.ondelete]
+    if not missing:
+        return
+
+    if connection.dialect.name != 'sqlite':
+        for column in missing:
+            if (column,) in existing:
+                connection.execute(DropConstraint(ForeignKeyConstraint(
+                    [sale.c[column]], [f'{existing[(column,)]["referred_table"]}.id'],
+                    name=existing[(column,)]['name'])))
+            constraint = wanted[column]
+            sale.append_constraint(constraint)
+            connection.execute(AddConstraint(constraint))
+        return
+
+    # SQLite cannot add a constraint to an existing table: copy the rows into
+    # a new table that has them, then swap it in and recreate the indexes
+    indexes = inspect(connection).get_indexes('sale')
+    kept = [ForeignKeyConstraint(foreign_key['constrained_columns'],
+                                 [f"{foreign_key['referred_table']}.{name}" for name in foreign_key['referred_columns']],
+                                 ondelete=foreign_key['options'].get('ondelete'))
+            for columns, foreign_key in existing.items() if columns not in {(column,) for column in wanted}]
+    rebuilt = Table(
+        'sale_rebuilt', table_metadata,
+        *(Column(column.name, column.type, primary_key=column.primary_key, nullable=column.nullable,
+                 server_default=column.server_default) for column in sale.columns),
+        *kept, *wanted.values()
+    )
+    rebuilt.create(connection)
+    names = [column.name for column in sale.columns]
+    connection.execute(insert(rebuilt).from_select(names, select(*sale.columns)))
+    sale.drop(connection)
+    connection.exec_driver_sql('ALTER TABLE sale_rebuilt RENAME TO sale')
+    for index in indexes:
+        create_index(connection, 'sale', index['name'], *index['column_names'], unique=bool(index['unique']))
+
+
+# Applied in this order; never rename or reorder an entry once it has shipped
+MIGRATIONS = [
+    ('0001_add_lookup_indexes', add_lookup_indexes),
+    ('0002_add_sale_foreign_keys', add_sale_foreign_keys),
+    ('0003_add_sale_created_at', add_sale_created_at),
+    ('0004_add_vendor_sales_stats', add_vendor_sales_stats),
+    ('0005_add_product_search', add_product_search),
+    ('0006_merge_cart_duplicates', merge_cart_duplicates),
+    ('0007_add_cart_created_at_index', add_cart_created_at_index),
+    ('0008_add_catalog_versions', add_catalog_versions),
+    ('0009_store_money_in_cents', store_money_in_cents),
+    ('0010_add_cart_updated_at', add_cart_updated_at),
+    ('0011_add_sale_foreign_key_constraints', add_sale_foreign_key_constraints),
+]
+
+
+def lock_schema(connection):
+    """
+    Hold an exclusive lock for the rest of the connection's transaction, so
+    that processes starting at the same time upgrade the database one by one.
+    """
+    if connection.dialect.name == 'sqlite':
+        # Also waits, up to the busy timeout, for a lock held by another process
+        connection.exec_driver_sql('BEGIN EXCLUSIVE')
+    elif connection.dialect.name == 'postgresql':
+        connection.execute(select(func.pg_advisory_xact_lock(SCHEMA_LOCK_ID)))
+
+
+def upgrade(engine, app_metadata):
+    """
+    Bring the database up to date with the models in app_metadata.
+
+    Runs in a single transaction under lock_schema(): a process that has to
+    wait for another one's upgrade then finds its steps already applied, and
+    a step that fails rolls the whole upgrade back. Returns the ids of the
+    migrations that ran.
+    """
+    with engine.begin() as connection:
+        lock_schema(connection)
+        if not inspect(connection).has_table('user'):
+            # A new database: build the current schema directly, there is nothing to migrate
+            app_metadata.create_all(connection)
+            metadata.create_all(connection)
+            connection.execute(schema_migrations.insert(), [{'id': migration_id} for migration_id, _ in MIGRATIONS])
+            return []
+
+        metadata.create_all(connection)
+        applied = set(connection.scalars(schema_migrations.select().with_only_columns(schema_migrations.c.id)))
+        ran = []
+        for migration_id, migrate in MIGRATIONS:
+            if migration_id in applied:
+                continue
+            migrate(connection)
+            connection.execute(schema_migrations.insert().values(id=migration_id))
+            ran.append(migration_id)
+
+        # Tables that were added to the models without a migration of their own
+        app_metadata.create_all(connection)
+    return ran
+
+
+if __name__ == '__main__':
+    from app import build_app, db
+
+    with build_app().app_context():
+        ran = upgrade(db.engine, db.metadata)
+    print('Applied: ' + ', '.join(ran) if ran else 'Database is up to date')
@@ -0,0 +1,55 @@
+"""
+Money amounts as integer cents.
+
+Prices, sale totals, vendor revenue and the vendor sales stats are stored in
+integer columns counting cents. Line totals are price * quantity and every
+aggregate is a plain integer sum, in Python or with SUM() in SQL, so totals
+are exact and the checkout path allocates no Decimal or float per row.
+
+Amounts are only converted at the edges of the API: parse_cents() for prices
+sent by clients, and to_units() or format_cents() in responses, which keep
+the shapes the endpoints have always returned (a number for prices, a string
+with two decimals for totals and revenue).
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+CENT = Decimal('0.01')
+# Largest price in cents; fits the 32-bit integer price column on any database
+MAX_CENTS = 2 ** 31 - 1
+
+
+def parse_cents(value, name='amount'):
+    """
+    Return a price given as a string or number in whole units as integer cents.
+
+    Raises ValueError, with a message naming the value as name, unless value
+    is a number from 0 to MAX_CENTS cents.
+    """
+    if isinstance(value, bool):
+        raise ValueError(f'{name} must be a number')
+    try:
+        amount = Decimal(str(value).strip())
+    except ArithmeticError:
+        raise ValueError(f'{name} must be a number')
+    if not amount.is_finite():
+        raise ValueError(f'{name} must be a number')
+    try:
+        # Half a cent or more rounds up, as a cashier would
+        cents = int(amount.quantize(CENT, rounding=ROUND_HALF_UP) * 100)
+    except ArithmeticError:
+        # InvalidOperation when the amount has more digits than the context allows
+        cents = None
+    if cents is None or not 0 <= cents <= MAX_CENTS:
+        raise ValueError(f'{name} must be between 0.00 and {format_cents(MAX_CENTS)}')
+    return cents
+
+
+def to_units(cents):
+    """Return cents as a number of whole units, for JSON prices."""
+    return cents / 100
+
+
+def format_cents(cents):
+    """Return cents as a string with two decimals, e.g. 1999 -> '19.99'."""
+    units, rest = divmod(abs(cents), 100)
+    return f"{'-' if cents < 0 else ''}{units}.{rest:02d}"
@@ -0,0 +1,90 @@
+"""
+Password hashing policy.
+
+Hashes are stored as ``method$salt$hash``, the format werkzeug.security uses,
+with the work factor in the method so each hash can be checked against the
+current policy:
+
+* ``scrypt:<n>:<r>:<p>`` (default): memory-hard, n sets the cost and memory
+  (128 * n * r bytes per hash);
+* ``pbkdf2:sha256:<iterations>``: for platforms whose OpenSSL lacks scrypt.
+
+Hashes written under older settings (including the original single-round
+``sha256$...`` hashes) still verify. needs_rehash() tells the caller to
+store a fresh hash after a successful login, so the whole user table moves
+to the current policy as people sign in.
+
+Hashing is deliberately slow. With ``workers`` set, hashes run on a bounded
+thread pool: hashlib releases the GIL while it works, so this caps how many
+CPU cores password checks can occupy at once and a burst of logins queues
+instead of starving every other request thread of CPU.
+"""
+import hashlib
+import hmac
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash
+
+SALT_CHARS = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+
+# Derived key length; keeps the stored hash within the 120 character password column
+KEY_LENGTH = 32
+
+
+class PasswordPolicy:
+    """
+    Hash and verify passwords with a configurable algorithm and work factor.
+    """
+
+    def __init__(self, method='scrypt', scrypt_n=2 ** 14, scrypt_r=8, scrypt_p=1,
+                 pbkdf2_iterations=600000, salt_length=16, workers=0):
+        if method == 'scrypt':
+            self.method = f'scrypt:{scrypt_n}:{scrypt_r}:{scrypt_p}'
+        elif method == 'pbkdf2':
+            self.method = f'pbkdf2:sha256:{pbkdf2_iterations}'
+        else:
+            raise ValueError(f'Unknown password hash method: {method}')
+        self.salt_length = salt_length
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password') if workers else None
+
+    def hash(self, password):
+        """Return a salted hash of password under the current policy."""
+        salt = ''.join(secrets.choice(SALT_CHARS) for _ in range(self.salt_length))
+        return f'{self.method}${salt}${self._run(derive, self.method, salt, password)}'
+
+    def verify(self, stored_hash, password):
+        """Check password against a stored hash written under any policy."""
+        if stored_hash.count('$') < 2:
+            return False
+        method, salt, expected = stored_hash.split('$', 2)
+        if not method.startswith('scrypt:'):
+            # pbkdf2 and the older werkzeug methods
+            return self._run(check_password_hash, stored_hash, password)
+        try:
+            actual = self._run(derive, method, salt, password)
+        except ValueError:
+            return False
+        return hmac.compare_digest(actual, expected)
+
+    def needs_rehash(self, stored_hash):
+        """True if stored_hash was written with a different method or work factor."""
+        return stored_hash.split('$', 1)[0] != self.method
+
+    def _run(self, function, *args):
+        if self._pool is None:
+            return function(*args)
+        return self._pool.submit(function, *args).result()
+
+
+def derive(method, salt, password):
+    """Return the hex digest of password for a ``scrypt:...`` or ``pbkdf2:...`` method."""
+    name, *params = method.split(':')
+    if name == 'scrypt':
+        n, r, p = (int(value) for value in params)
+        return hashlib.scrypt(password.encode('utf-8'), salt=salt.encode('utf-8'), n=n, r=r, p=p,
+                              maxmem=132 * n * r * p, dklen=KEY_LENGTH).hex()
+    if name == 'pbkdf2':
+        digest, iterations = params
+        return hashlib.pbkdf2_hmac(digest, password.encode('utf-8'), salt.encode('utf-8'), int(iterations)).hex()
+    raise ValueError(f'Unsupported password hash method: {method}')
@@ -0,0 +1,181 @@
+"""
+In-process scheduler for periodic database maintenance.
+
+A single daemon thread runs each registered job every ``interval`` seconds.
+Jobs run one at a time, in the order they fall due, so maintenance never
+competes with itself for the SQLite write lock. A job returns the number of
+rows it affected (or None); the scheduler records when it last ran, how long
+it took, what it returned and whether it failed, for the status endpoint.
+
+Every server process starts a scheduler, but only one of them runs the jobs:
+with ``lock_path`` set, a scheduler runs jobs only while it holds an
+exclusive lock on that file. The others check every LOCK_RETRY_INTERVAL
+seconds and take over when the holder exits, e.g. when gunicorn recycles
+it. Without fcntl (Windows) every process runs the jobs, which are
+idempotent, so that is slower but harmless.
+"""
+import logging
+import threading
+import time
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+log = logging.getLogger('maintenance')
+
+# Seconds between attempts to take the lock file from another process
+LOCK_RETRY_INTERVAL = 60
+
+
+class Job:
+    def __init__(self, name, interval, function):
+        self.name = name
+        self.interval = interval
+        self.function = function
+        self.next_run = None
+        self.runs = 0
+        self.failures = 0
+        self.last_started_at = None
+        self.last_duration = None
+        self.last_rows = None
+        self.total_rows = 0
+        self.last_error = None
+
+
+class MaintenanceScheduler:
+    """
+    Runs jobs periodically on a background thread.
+
+    ``context`` is called around every job run, e.g. ``app.app_context``, so
+    that jobs can use the app's database session. ``lock_path`` names the file
+    that elects the one process running the jobs; None runs them in every
+    process.
+    """
+
+    def __init__(self, context=None, lock_path=None):
+        self.context = context
+        self.lock_path = lock_path
+        self._lock_file = None
+        self._jobs = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_job(self, name, interval, function):
+        """Run function every interval seconds, the first time one interval after start."""
+        with self._lock:
+            self._jobs.append(Job(name, interval, function))
+
+    def start(self):
+        """Start the background thread, if it is not running already."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            now = time.monotonic()
+            for job in self._jobs:
+                job.next_run = now + job.interval
+            self._thread = threading.Thread(target=self._loop, name='maintenance', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the background thread after the job it is running, if any."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        self._stop.set()
+        if thread is not None:
+            thread.join()
+        if self._lock_file is not None:
+            # Closing the file releases the lock for another process to take
+            self._lock_file.close()
+            self._lock_file = None
+
+    @property
+    def active(self):
+        """Whether this process runs the jobs, rather than waiting for another one's lock."""
+        return self._thread is not None and (self.lock_path is None or fcntl is None or self._lock_file is not None)
+
+    def _hold_lock(self):
+        """Take the lock file if no other process holds it; return whether this process holds it."""
+        if self.lock_path is None or fcntl is None or self._lock_file is not None:
+            return True
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        log.info('Running the maintenance jobs in this process')
+        return True
+
+    def run_job(self, name):
+        """Run the named job now, on the calling thread; return its rows affected."""
+        for job in self._jobs:
+            if job.name == name:
+                return self._run(job)
+        raise KeyError(name)
+
+    def status(self):
+        """Return the state of every job."""
+        now = time.monotonic()
+        with self._lock:
+            return [{
+                'name': job.name,
+                'interval_seconds': job.interval,
+                'runs': job.runs,
+                'failures': job.failures,
+                'last_started_at': job.last_started_at.isoformat() if job.last_started_at else None,
+                'last_duration_seconds': job.last_duration,
+                'last_rows_affected': job.last_rows,
+                'total_rows_affected': job.total_rows,
+                'last_error': job.last_error,
+                'next_run_in_seconds': max(0.0, round(job.next_run - now, 3)) if self._thread else None
+            } for job in self._jobs]
+
+    def _loop(self):
+        while not self._stop.is_set():
+            if not self._hold_lock():
+                # Another process runs the jobs; check again later in case it exits
+                self._stop.wait(LOCK_RETRY_INTERVAL)
+                continue
+            with self._lock:
+                job = min(self._jobs, key=lambda job: job.next_run, default=None)
+            if job is None:
+                self._stop.wait(60)
+                continue
+            delay = job.next_run - time.monotonic()
+            if delay > 0:
+                # Sleep until the job is due, unless stop() is called first
+                if self._stop.wait(delay):
+                    break
+                continue
+            self._run(job)
+
+    def _run(self, job):
+        started_at = datetime.utcnow()
+        start = time.perf_counter()
+        rows = error = None
+        try:
+            if self.context is None:
+                rows = job.function()
+            else:
+                with self.context():
+                    rows = job.function()
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+            log.exception('Maintenance job %s failed', job.name)
+        duration = time.perf_counter() - start
+        with self._lock:
+            job.runs += 1
+            job.failures += error is not None
+            job.last_started_at = started_at
+            job.last_duration = round(duration, 6)
+            job.last_rows = rows
+            job.total_rows += rows or 0
+            job.last_error = error
+            job.next_run = time.monotonic() + job.interval
+        return rows
@@ -0,0 +1,80 @@
+"""
+Full-text product search backed by an SQLite FTS5 index.
+
+product_search is an external-content FTS5 table over product.name,
+description and vendor_name: it stores only the inverted index and reads the
+text back from the product table. Triggers on product keep it in sync with
+every insert, update and delete, whether it comes from a route, the bulk
+import or a migration. Other databases have no index and are searched with
+LIKE instead (see search_products in app.py).
+"""
+import re
+
+from sqlalchemy import DDL, column, event, func, literal_column, table
+
+# Relative weight of a match in name, description and vendor_name for ranking
+SEARCH_WEIGHTS = (10.0, 1.0, 3.0)
+
+PRODUCT_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5("
+    "name, description, vendor_name, content='product', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS product_search_insert AFTER INSERT ON product BEGIN "
+    "INSERT INTO product_search(rowid, name, description, vendor_name) "
+    "VALUES (new.id, new.name, new.description, new.vendor_name); END",
+    "CREATE TRIGGER IF NOT EXISTS product_search_delete AFTER DELETE ON product BEGIN "
+    "INSERT INTO product_search(product_search, rowid, name, description, vendor_name) "
+    "VALUES ('delete', old.id, old.name, old.description, old.vendor_name); END",
+    # Only the indexed columns; a price change does not touch the index
+    "CREATE TRIGGER IF NOT EXISTS product_search_update AFTER UPDATE OF name, description, vendor_name ON product BEGIN "
+    "INSERT INTO product_search(product_search, rowid, name, description, vendor_name) "
+    "VALUES ('delete', old.id, old.name, old.description, old.vendor_name); "
+    "INSERT INTO product_search(rowid, name, description, vendor_name) "
+    "VALUES (new.id, new.name, new.description, new.vendor_name); END",
+]
+
+product_search = table('product_search', column('rowid'))
+
+# Words as FTS5's unicode61 tokenizer sees them
+TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def install_product_search(product_table):
+    """
+    Create the search index and its triggers together with the product table.
+
+    Covers db.create_all() on a new SQLite database; existing databases get
+    them from a migration. Dropping the product table drops the index too, so
+    it never points at rows of a recreated table.
+    """
+    for statement in PRODUCT_SEARCH_DDL:
+        event.listen(product_table, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+    event.listen(product_table, 'before_drop',
+                 DDL('DROP TABLE IF EXISTS product_search').execute_if(dialect='sqlite'))
+
+
+def search_terms(text):
+    """Split user input into the words to search for."""
+    return TOKEN.findall(text or '')
+
+
+def match_expression(terms):
+    """
+    Build an FTS5 MATCH query that finds rows containing all the terms.
+
+    Every term is quoted, so user input can never be read as FTS5 syntax. The
+    last term also matches as a prefix, for search-as-you-type clients.
+    """
+    quoted = ['"' + term.replace('"', '""') + '"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def match_clause(terms):
+    """WHERE clause matching product_search rows against the terms."""
+    return literal_column('product_search').op('MATCH')(match_expression(terms))
+
+
+def rank_order():
+    """ORDER BY expression putting the best matches first (bm25 is lower for better matches)."""
+    return func.bm25(literal_column('product_search'), *SEARCH_WEIGHTS)
@@ -0,0 +1,47 @@
+"""
+In-memory denylist of revoked access tokens.
+
+Access tokens are stateless, so a token stays valid until it expires unless
+its id (the ``jti`` claim) is listed here. An entry is only needed until the
+token's own expiry, after which the JWT check rejects the token anyway, so
+entries are dropped at that point and the list stays as small as the number
+of tokens revoked within one token lifetime.
+
+The list lives in the process that revoked the token. With several server
+processes, a revocation only takes effect in the process that handled it
+until the token expires; pass a shared store with the same ``add`` and
+``contains`` methods to revoke across processes.
+"""
+import threading
+import time
+
+
+class TokenDenylist:
+    """
+    Thread-safe set of token ids, each kept until the expiry time it was added with.
+    """
+
+    def __init__(self):
+        self._expiry = {}
+        self._lock = threading.Lock()
+
+    def add(self, jti, expires_at):
+        """Revoke the token jti until expires_at (a Unix timestamp)."""
+        with self._lock:
+            self._purge(time.time())
+            self._expiry[jti] = expires_at
+
+    def contains(self, jti):
+        with self._lock:
+            expires_at = self._expiry.get(jti)
+            return expires_at is not None and expires_at > time.time()
+
+    def __len__(self):
+        with self._lock:
+            self._purge(time.time())
+            return len(self._expiry)
+
+    def _purge(self, now):
+        expired = [jti for jti, expires_at in self._expiry.items() if expires_at <= now]
+        for jti in expired:
+            del self._expiry[jti]
@@ -0,0 +1,10 @@
+"""
+WSGI entry point for running the API under a production server:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+`python app.py` still starts the single-process development server.
+"""
+from app import create_app
+
+app = create_app()
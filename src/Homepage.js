@@ -4,6 +4,7 @@ import { IconButton } from '@mui/material';
 import AddShoppingCart from '@mui/icons-material/AddShoppingCart';
 import { Snackbar } from '@mui/material';
 import Alert from '@mui/material/Alert';
+import fetchAllProducts from './fetchAllProducts';
 
 function Homepage({ onAddToCart }) {
 	const [products, setProducts] = useState([]);
@@ -17,9 +18,8 @@ function Homepage({ onAddToCart }) {
 	};
 
 	useEffect(() => {
-		fetch('http://127.0.0.1:5000/products')
-			.then((response) => response.json())
-			.then((data) => setProducts(data.products))
+		fetchAllProducts('http://127.0.0.1:5000/products')
+			.then((allProducts) => setProducts(allProducts))
 			.catch((error) => {
 				console.error('Error fetching products:', error);
 			});
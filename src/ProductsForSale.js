@@ -26,6 +26,7 @@ import {
 	TableRow,
 	Paper,
 } from '@mui/material';
+import fetchAllProducts from './fetchAllProducts';
 
 const ProductsForSale = () => {
 	const [products, setProducts] = useState([]);
@@ -34,15 +35,14 @@ const ProductsForSale = () => {
 
 	const fetchProducts = useCallback(async () => {
 		try {
-			const response = await fetch('http://127.0.0.1:5000/get_products', {
+			const allProducts = await fetchAllProducts('http://127.0.0.1:5000/get_products', {
 				method: 'GET',
 				headers: {
 					Authorization: `Bearer ${localStorage.getItem('access_token')}`,
 				},
 			});
-			const data = await response.json();
 
-			setProducts(data.products);
+			setProducts(allProducts);
 		} catch (error) {
 			console.error('Error fetching products:', error);
 		}
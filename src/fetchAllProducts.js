@@ -0,0 +1,27 @@
+// src/fetchAllProducts.js
+
+// Largest page the catalog endpoints serve (MAX_PAGE_SIZE in backend/app.py)
+const PAGE_SIZE = 200;
+
+// The catalog endpoints return one page at a time; follow next_after_id
+// until the last page and return every product.
+async function fetchAllProducts(url, options = {}) {
+	const products = [];
+	let afterId = null;
+	do {
+		const params = new URLSearchParams({ limit: PAGE_SIZE });
+		if (afterId !== null) {
+			params.set('after_id', afterId);
+		}
+		const response = await fetch(`${url}?${params}`, options);
+		if (!response.ok) {
+			throw new Error(`Request failed with status ${response.status}`);
+		}
+		const data = await response.json();
+		products.push(...data.products);
+		afterId = data.next_after_id;
+	} while (afterId !== null && afterId !== undefined);
+	return products;
+}
+
+export default fetchAllProducts;